@@ -134,8 +134,73 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 BASE_STORAGE_DIR = BASE_DIR / getenv('STORAGE_PATH')
 BASE_DESTINATION_DIR = BASE_DIR / getenv('DESTINATION_PATH')
 
+DISCOVERY_WORKERS = int(getenv('DISCOVERY_WORKERS', 4))
+DISCOVERY_RESCAN_MINUTES = int(getenv('DISCOVERY_RESCAN_MINUTES', 60))
+DISCOVERY_QUIESCENCE_SECONDS = float(getenv('DISCOVERY_QUIESCENCE_SECONDS', 120))
+DISCOVERY_SENTINEL_FILENAME = getenv('DISCOVERY_SENTINEL_FILENAME', '')
+DISCOVERY_LOCK_FILE = getenv('DISCOVERY_LOCK_FILE', '/tmp/discover_packages.lock')
+DISCOVERY_UNREADY_ALERT_HOURS = int(getenv('DISCOVERY_UNREADY_ALERT_HOURS', 24))
+WATCH_DEBOUNCE_SECONDS = float(getenv('WATCH_DEBOUNCE_SECONDS', 30))
+WATCH_POLL_INTERVAL_SECONDS = float(getenv('WATCH_POLL_INTERVAL_SECONDS', 10))
+FIXITY_WORKERS = int(getenv('FIXITY_WORKERS', 4))
+PROBE_WORKERS = int(getenv('PROBE_WORKERS', 4))
+PROBE_CACHE_MAX_AGE_DAYS = int(getenv('PROBE_CACHE_MAX_AGE_DAYS', 30))
+PROBE_CACHE_PARTIAL_HASH = getenv('PROBE_CACHE_PARTIAL_HASH', 'false').lower() == 'true'
+
+VISUALS_ENABLED = getenv('VISUALS_ENABLED', 'true').lower() == 'true'
+VISUALS_WORKERS = int(getenv('VISUALS_WORKERS', 2))
+WAVEFORM_PEAKS = int(getenv('WAVEFORM_PEAKS', 1000))
+WAVEFORM_SAMPLE_RATE = int(getenv('WAVEFORM_SAMPLE_RATE', 4000))
+SPRITE_THUMBNAILS = int(getenv('SPRITE_THUMBNAILS', 50))
+QC_CHECKS = [path.strip() for path in getenv(
+    'QC_CHECKS',
+    'package_review.qc.SilenceCheck,package_review.qc.BlackFrameCheck,package_review.qc.ClippingCheck').split(',') if path.strip()]
+QC_WORKERS = int(getenv('QC_WORKERS', 2))
+QC_SILENCE_THRESHOLD = getenv('QC_SILENCE_THRESHOLD', '-50dB')
+QC_SILENCE_SECONDS = float(getenv('QC_SILENCE_SECONDS', 2))
+QC_BLACK_SECONDS = float(getenv('QC_BLACK_SECONDS', 2))
+QC_CLIPPING_DB = float(getenv('QC_CLIPPING_DB', -0.1))
+PROXY_ENABLED = getenv('PROXY_ENABLED', 'false').lower() == 'true'
+PROXY_HLS = getenv('PROXY_HLS', 'false').lower() == 'true'
+PROXY_WORKERS = int(getenv('PROXY_WORKERS', 2))
+PROXY_VIDEO_HEIGHT = int(getenv('PROXY_VIDEO_HEIGHT', 480))
+PROXY_AUDIO_BITRATE = getenv('PROXY_AUDIO_BITRATE', '96k')
+PROXY_CACHE_MAX_BYTES = int(getenv('PROXY_CACHE_MAX_GB', 50)) * 1024 ** 3
+PROXY_TEMP_MAX_AGE_HOURS = int(getenv('PROXY_TEMP_MAX_AGE_HOURS', 24))
+PROXY_ROOT = BASE_DIR / getenv('DERIVATIVE_PATH', 'derivatives') / 'proxies'
+PROXY_URL = '/proxies/'
+
 MEDIA_ROOT = BASE_STORAGE_DIR
 MEDIA_URL = '/media/'
+MEDIA_SENDFILE_HEADER = getenv('MEDIA_SENDFILE_HEADER', '')
+
+CONFIG_TTL = int(getenv('CONFIG_TTL', 300))
+PACKAGE_LIST_PAGE_SIZE = int(getenv('PACKAGE_LIST_PAGE_SIZE', 50))
+SEARCH_RESULTS_LIMIT = int(getenv('SEARCH_RESULTS_LIMIT', 100))
+AS_BATCH_SIZE = int(getenv('AS_BATCH_SIZE', 25))
+JOB_WORKERS = int(getenv('JOB_WORKERS', 2))
+JOB_STALE_MINUTES = int(getenv('JOB_STALE_MINUTES', 60))
+TRANSFER_WORKERS = int(getenv('TRANSFER_WORKERS', 4))
+OUTBOX_BATCH_SIZE = int(getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_MAX_ATTEMPTS = int(getenv('OUTBOX_MAX_ATTEMPTS', 10))
+OUTBOX_BACKOFF_SECONDS = float(getenv('OUTBOX_BACKOFF_SECONDS', 30))
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "archivesspace": {
+        "BACKEND": getenv('AS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": getenv('AS_CACHE_LOCATION', 'archivesspace'),
+        "TIMEOUT": int(getenv('AS_CACHE_TTL', 3600)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(getenv('AS_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
 
 AQUILA = {
     'baseurl': getenv('AQUILA_BASEURL')
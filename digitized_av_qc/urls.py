@@ -14,22 +14,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf import settings
-from django.conf.urls.static import static
 from django.urls import re_path
 
-from package_review.views import (PackageApproveView, PackageBulkApproveView,
+from package_review.views import (BulkActionProgressView, MediaFileSpriteView,
+                                  MediaFileView, PackageApproveView,
+                                  PackageBulkApproveView,
                                   PackageBulkRejectView,
                                   PackageDataRefreshView, PackageDetailView,
-                                  PackageListView, PackageRejectView)
+                                  PackageListView, PackageRejectView,
+                                  PackageSearchView, PackageTreeView,
+                                  ProxyFileView)
 
 urlpatterns = [
     # path("admin/", admin.site.urls),
     re_path(r'^$', PackageListView.as_view(), name='package-list'),
+    re_path(r'^search/$', PackageSearchView.as_view(), name='package-search'),
     re_path(r'^package/(?P<pk>[\d]+)/$', PackageDetailView.as_view(), name='package-detail'),
+    re_path(r'^package/(?P<pk>[\d]+)/tree/$', PackageTreeView.as_view(), name='package-tree'),
     re_path(r'^package/bulk-approve/$', PackageBulkApproveView.as_view(), name='package-bulk-approve'),
     re_path(r'^package/bulk-reject/$', PackageBulkRejectView.as_view(), name='package-bulk-reject'),
     re_path(r'^package/approve/', PackageApproveView.as_view(), name='package-approve'),
     re_path(r'^package/reject/', PackageRejectView.as_view(), name='package-reject'),
+    re_path(r'^bulk-action/(?P<pk>[\d]+)/$', BulkActionProgressView.as_view(), name='bulk-action-progress'),
     re_path(r'^package/refresh-data/', PackageDataRefreshView.as_view(), name='refresh-data'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^media/(?P<path>.+)$', MediaFileView.as_view(), name='media'),
+    re_path(r'^media-file/(?P<pk>[\d]+)/sprite/$', MediaFileSpriteView.as_view(), name='media-file-sprite'),
+    re_path(r'^proxies/(?P<path>.+)$', ProxyFileView.as_view(), name='proxy'),
+]
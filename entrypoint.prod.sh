@@ -17,5 +17,15 @@ python ./manage.py fetch_rights_statements
 # start cron
 cron
 
+# resolve storage paths as settings.py does, so Apache can send files from them
+resolve_path() {
+  case "$1" in
+    /*) echo "$1" ;;
+    *) echo "/var/www/digitized-av-qc/$1" ;;
+  esac
+}
+export XSENDFILE_STORAGE_ROOT=$(resolve_path "$STORAGE_PATH")
+export XSENDFILE_DERIVATIVE_ROOT=$(resolve_path "${DERIVATIVE_PATH:-derivatives}")
+
 # start Apache
 apache2ctl -D FOREGROUND
\ No newline at end of file
@@ -1,8 +1,17 @@
+import logging
+import threading
+import time
+
 import boto3
 from asnake.aspace import ASpace
 from aws_assume_role_lib import assume_role
+from botocore.exceptions import BotoCoreError, ClientError
+from django.conf import settings
+from django.core.cache import caches
 from requests import Session
 
+SNS_BATCH_SIZE = 10
+
 
 class ArchivesSpaceClient(ASpace):
     """Client to interact with ArchivesSpace API."""
@@ -10,6 +19,32 @@ class ArchivesSpaceClient(ASpace):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.repository = kwargs['repository']
+        self.auth_lock = threading.Lock()
+        self.client.session.hooks['response'].append(self.reauthorize_expired_session)
+
+    def reauthorize_expired_session(self, response, *args, **kwargs):
+        """Logs in again and retries a request if the ArchivesSpace session has expired.
+
+        ASnake only retries requests which fail with a 403, while ArchivesSpace
+        reports expired sessions with a 412. Used as a requests response hook,
+        so a long-lived client only logs in again when its token expires.
+        """
+        if response.status_code != 412:
+            return response
+        try:
+            code = response.json().get('code')
+        except ValueError:
+            return response
+        if code not in ['SESSION_GONE', 'SESSION_EXPIRED']:
+            return response
+        header_name = self.client.config['session_header_name']
+        with self.auth_lock:
+            if self.client.session.headers.get(header_name) == response.request.headers.get(header_name):
+                self.client.authorize()
+        request = response.request.copy()
+        request.headers[header_name] = self.client.session.headers[header_name]
+        request.hooks = {'response': []}
+        return self.client.session.send(request, **kwargs)
 
     def has_structured_dates(self, dates_array):
         """Parses date array to determine if structured dates are available.
@@ -49,22 +84,98 @@ class ArchivesSpaceClient(ASpace):
             refid (string): RefID for an ArchivesSpace archival object.
 
         Returns:
-            object_title, av_number, object_uri, resource_title, resource_uri (tuple of strings): data about the object.
+            object_title, av_number, object_uri, resource_title, resource_uri, undated_object (tuple): data about the object.
         """
-        results = self.client.get(f"/repositories/{self.repository}/find_by_id/archival_objects?ref_id[]={refid}&resolve[]=archival_objects&resolve[]=archival_objects::resource").json()
-        try:
-            if len(results['archival_objects']) != 1:
-                raise Exception(f'Expecting to get one result for ref id {refid} but got {len(results["archival_objects"])} instead.')
-            object = results['archival_objects'][0]['_resolved']
-            av_number = self.get_av_number(object['instances'])
-            object_uri = object['uri']
-            resource = object['resource']['_resolved']
-            resource_title = resource['title']
-            resource_uri = resource['uri']
-            undated_object = self.has_structured_dates(object['dates'])
-            return object['display_string'], av_number, object_uri, resource_title, resource_uri, undated_object
-        except KeyError:
-            raise Exception(f'Unable to fetch results for {refid}. Got results {results}')
+        packages_data = self.get_packages_data([refid])
+        if refid not in packages_data:
+            raise Exception(f'Expecting to get one result for ref id {refid} but got none instead.')
+        return packages_data[refid]
+
+    def get_packages_data(self, refids, chunk_size=None):
+        """Fetch data about many objects in ArchivesSpace.
+
+        Archival objects are fetched with one request for each chunk of refids
+        rather than one request per refid, and resources are fetched once per
+        collection. Both are cached, so repeated lookups are served locally
+        until they expire or are invalidated.
+
+        Args:
+            refids (list of strings): RefIDs for ArchivesSpace archival objects.
+            chunk_size (int): maximum number of refids to look up in one request.
+
+        Returns:
+            packages_data (dict): tuples in the format returned by get_package_data,
+                keyed by refid. Refids which could not be found are omitted.
+        """
+        objects = self._get_archival_objects(list(refids), chunk_size or settings.AS_BATCH_SIZE)
+        resources = self._get_resources({object['resource']['ref'] for object in objects.values()})
+        return {refid: self._parse_package_data(object, resources[object['resource']['ref']]) for refid, object in objects.items()}
+
+    def invalidate_cache(self, refids):
+        """Removes cached archival objects and their resources.
+
+        Args:
+            refids (list of strings): RefIDs for ArchivesSpace archival objects.
+        """
+        object_keys = [self._archival_object_key(refid) for refid in refids]
+        objects = self.cache.get_many(object_keys)
+        resource_keys = {self._resource_key(object['resource']['ref']) for object in objects.values()}
+        self.cache.delete_many(object_keys + list(resource_keys))
+
+    @property
+    def cache(self):
+        return caches['archivesspace']
+
+    def _archival_object_key(self, refid):
+        return f'archival_object:{self.repository}:{refid}'
+
+    def _resource_key(self, uri):
+        return f'resource:{uri}'
+
+    def _get_archival_objects(self, refids, chunk_size):
+        """Fetches archival objects by refid, using cached objects where available."""
+        cached = self.cache.get_many([self._archival_object_key(refid) for refid in refids])
+        objects = {object['ref_id']: object for object in cached.values()}
+        missing = [refid for refid in refids if refid not in objects]
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            results = self.client.get(
+                f"/repositories/{self.repository}/find_by_id/archival_objects",
+                params={
+                    'ref_id[]': chunk,
+                    'resolve[]': ['archival_objects']}).json()
+            try:
+                fetched = {result['_resolved']['ref_id']: result['_resolved'] for result in results['archival_objects']}
+            except KeyError:
+                raise Exception(f'Unable to fetch results for {", ".join(chunk)}. Got results {results}')
+            self.cache.set_many({self._archival_object_key(refid): object for refid, object in fetched.items()})
+            objects.update(fetched)
+        return objects
+
+    def _get_resources(self, uris):
+        """Fetches resources by URI, using cached resources where available.
+
+        Only the fields stored on packages are cached, since full resource
+        records can be large.
+        """
+        cached = self.cache.get_many([self._resource_key(uri) for uri in uris])
+        resources = {resource['uri']: resource for resource in cached.values()}
+        for uri in uris:
+            if uri not in resources:
+                result = self.client.get(uri).json()
+                try:
+                    resources[uri] = {'title': result['title'], 'uri': result['uri']}
+                except KeyError:
+                    raise Exception(f'Unable to fetch resource {uri}. Got results {result}')
+                self.cache.set(self._resource_key(uri), resources[uri])
+        return resources
+
+    def _parse_package_data(self, object, resource):
+        """Parses an archival object and its resource into the data stored on a package."""
+        av_number = self.get_av_number(object['instances'])
+        object_uri = object['uri']
+        undated_object = self.has_structured_dates(object['dates'])
+        return object['display_string'], av_number, object_uri, resource['title'], resource['uri'], undated_object
 
 
 class AquilaClient(object):
@@ -83,19 +194,32 @@ class AquilaClient(object):
 
 
 class AWSClient(object):
+    _sessions = {}
+    _clients = {}
+    _lock = threading.Lock()
 
     def __init__(self, resource, role_arn):
         """Gets Boto3 client which authenticates with a specific IAM role."""
         self.client = self.get_client_with_role(resource, role_arn)
 
     def get_client_with_role(self, resource, role_arn):
-        """Gets Boto3 client which authenticates with a specific IAM role."""
-        session = boto3.Session()
-        assumed_role_session = assume_role(session, role_arn)
-        return assumed_role_session.client(resource)
+        """Gets Boto3 client which authenticates with a specific IAM role.
 
-    def deliver_message(self, sns_topic, package, message, outcome, rights_ids=None):
-        """Delivers message to SNS Topic."""
+        Assumed role sessions are cached per role and clients per service and
+        role for the life of the process. Their credentials are refreshed by
+        botocore shortly before they expire, and Boto3 clients are thread-safe
+        once created, so a single client is shared by every thread.
+        """
+        key = (resource, role_arn)
+        with self._lock:
+            if key not in self._clients:
+                if role_arn not in self._sessions:
+                    self._sessions[role_arn] = assume_role(boto3.Session(), role_arn)
+                self._clients[key] = self._sessions[role_arn].client(resource)
+            return self._clients[key]
+
+    def get_message_attributes(self, package, outcome, rights_ids=None):
+        """Returns SNS message attributes describing a package and QC outcome."""
         attributes = {
             'service': {
                 'DataType': 'String',
@@ -120,7 +244,61 @@ class AWSClient(object):
                 'DataType': 'String',
                 'StringValue': rights_ids,
             }
+        return attributes
+
+    def deliver_message(self, sns_topic, package, message, outcome, rights_ids=None):
+        """Delivers message to SNS Topic."""
         self.client.publish(
             TopicArn=sns_topic,
             Message=message,
-            MessageAttributes=attributes)
+            MessageAttributes=self.get_message_attributes(package, outcome, rights_ids))
+
+    def deliver_messages(self, sns_topic, messages, max_attempts=3, backoff=1):
+        """Delivers many messages to an SNS Topic using batched requests.
+
+        Messages are published ten at a time. Entries which fail for reasons
+        other than a problem with the message itself, including every entry
+        of a request which raised an error, are retried with exponential
+        backoff. An error in one request does not affect the others, so
+        messages which have been published are never reported as failed.
+
+        Args:
+            sns_topic (string): ARN of the SNS topic.
+            messages (list of tuples): package, message, outcome and rights_ids for each message.
+            max_attempts (int): maximum number of times to try publishing each message.
+            backoff (float): seconds to wait before the first retry.
+
+        Returns:
+            failed (list of tuples): messages which could not be delivered.
+        """
+        entries = {
+            str(index): {
+                'Id': str(index),
+                'Message': message,
+                'MessageAttributes': self.get_message_attributes(package, outcome, rights_ids)}
+            for index, (package, message, outcome, rights_ids) in enumerate(messages)}
+        failed = set()
+        for attempt in range(max_attempts):
+            if attempt:
+                time.sleep(backoff * 2 ** (attempt - 1))
+            pending, entries = entries, {}
+            batch = list(pending.values())
+            for start in range(0, len(batch), SNS_BATCH_SIZE):
+                chunk = batch[start:start + SNS_BATCH_SIZE]
+                try:
+                    response = self.client.publish_batch(
+                        TopicArn=sns_topic,
+                        PublishBatchRequestEntries=chunk)
+                except (BotoCoreError, ClientError) as e:
+                    logging.warning(f'Unable to publish {len(chunk)} messages to {sns_topic}: {e}')
+                    entries.update((entry['Id'], entry) for entry in chunk)
+                    continue
+                for failure in response.get('Failed', []):
+                    if failure.get('SenderFault'):
+                        failed.add(failure['Id'])
+                    else:
+                        entries[failure['Id']] = pending[failure['Id']]
+            if not entries:
+                break
+        failed.update(entries)
+        return [messages[int(entry_id)] for entry_id in sorted(failed, key=int)]
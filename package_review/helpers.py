@@ -1,17 +1,89 @@
+import logging
+import threading
+import time
+from os import getenv
+
 from django.conf import settings
 
-from .clients import AWSClient
+from .clients import ArchivesSpaceClient, AWSClient
 
+_config_cache = {}
+_config_refreshing = {}
+_config_lock = threading.Lock()
+_archivesspace_clients = {}
+_archivesspace_clients_lock = threading.Lock()
 
-def get_config(parameter_path):
+
+def _load_config(parameter_path):
+    """Fetches every parameter below a path from SSM, following pagination."""
     ssm_client = AWSClient('ssm', settings.AWS['role_arn']).client
     configuration = {}
-    param_details = ssm_client.get_parameters_by_path(
-        Path=parameter_path,
-        Recursive=False,
-        WithDecryption=True)
-    for param in param_details.get('Parameters', []):
-        param_path_array = param.get('Name').split("/")
-        section_name = param_path_array[-1]
-        configuration[section_name] = param.get('Value')
+    paginator = ssm_client.get_paginator('get_parameters_by_path')
+    for page in paginator.paginate(
+            Path=parameter_path,
+            Recursive=False,
+            WithDecryption=True):
+        for param in page.get('Parameters', []):
+            param_path_array = param.get('Name').split("/")
+            section_name = param_path_array[-1]
+            configuration[section_name] = param.get('Value')
     return configuration
+
+
+def _refresh_config(parameter_path):
+    try:
+        configuration = _load_config(parameter_path)
+        with _config_lock:
+            _config_cache[parameter_path] = (configuration, time.monotonic())
+    except Exception as e:
+        logging.exception(e)
+    finally:
+        with _config_lock:
+            _config_refreshing.pop(parameter_path, None)
+
+
+def get_config(parameter_path):
+    """Returns configuration stored in SSM below a path.
+
+    Parameters are loaded from SSM once per process. Once they are older than
+    CONFIG_TTL seconds the cached values are still returned, while a
+    background thread reloads them for later calls.
+
+    Args:
+        parameter_path (string): SSM path containing configuration parameters.
+
+    Returns:
+        configuration (dict): parameter values keyed by the last part of their names.
+    """
+    with _config_lock:
+        cached = _config_cache.get(parameter_path)
+        if cached and time.monotonic() - cached[1] > settings.CONFIG_TTL and parameter_path not in _config_refreshing:
+            thread = threading.Thread(target=_refresh_config, args=(parameter_path,), daemon=True)
+            _config_refreshing[parameter_path] = thread
+            thread.start()
+    if cached is None:
+        configuration = _load_config(parameter_path)
+        with _config_lock:
+            _config_cache[parameter_path] = (configuration, time.monotonic())
+        return dict(configuration)
+    return dict(cached[0])
+
+
+def get_archivesspace_client():
+    """Returns an authenticated ArchivesSpace client shared across the process.
+
+    Clients are created (and log in) once per set of credentials, and reuse
+    their session and connection pool for every later command or request.
+    Expired sessions are renewed by the client when a request fails.
+    """
+    configuration = get_config(f"/{getenv('ENV')}/{getenv('APP_CONFIG_PATH')}")
+    client_config = {
+        'baseurl': configuration.get('AS_BASEURL'),
+        'username': configuration.get('AS_USERNAME'),
+        'password': configuration.get('AS_PASSWORD'),
+        'repository': configuration.get('AS_REPO')}
+    key = tuple(client_config.values())
+    with _archivesspace_clients_lock:
+        if key not in _archivesspace_clients:
+            _archivesspace_clients[key] = ArchivesSpaceClient(**client_config)
+        return _archivesspace_clients[key]
@@ -1,15 +1,27 @@
+import fcntl
 import logging
-import subprocess
 import traceback
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from datetime import timedelta
+from multiprocessing import get_context
 from os import getenv
 
-from directory_tree import display_tree
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
-from package_review.clients import ArchivesSpaceClient, AWSClient
-from package_review.helpers import get_config
-from package_review.models import Package
+from package_review.clients import AWSClient
+from package_review.helpers import get_archivesspace_client
+from package_review.media import (ProbeCache, evict_stale_cache_entries,
+                                  file_identity, probe_files)
+from package_review.models import DirectorySnapshot, MediaFile, Package
+from package_review.proxies import evict_proxies, generate_proxy
+from package_review.qc import run_all_checks
+from package_review.storage import (check_fixity, directory_signature,
+                                    get_unready_reason, list_files)
+from package_review.visuals import compute_visuals
 
 logging.basicConfig(
     level=int(getenv('LOGGING_LEVEL', logging.INFO)),
@@ -28,77 +40,270 @@ class Command(BaseCommand):
         else:
             raise Exception(f'Unable to determine type of package {refid}')
 
-    def _get_duration(self, filepaths):
-        duration = 0.0
-        for fp in filepaths:
-            process = subprocess.Popen(
-                ['ffprobe',
-                 '-v',
-                 'error',
-                 '-show_entries',
-                 'format=duration',
-                 '-of',
-                 'default=noprint_wrappers=1:nokey=1',
-                 fp],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE)
-            out, _ = process.communicate()
-            duration += float(out.decode())
-        return duration
-
-    def _has_multiple_masters(self, master_files):
-        return bool(len(list(master_files)) > 1)
-
-    def _get_dir_tree(self, root_path):
-        return display_tree(root_path, string_rep=True, show_hidden=True)
+    def _get_duration(self, probes):
+        return sum(probe['duration'] for probe in probes)
+
+    def _has_multiple_masters(self, master_probes):
+        return bool(len(master_probes) > 1)
+
+    def _compute_visuals(self, filepath, probe, package_type, probe_cache, visuals_executor):
+        """Computes and caches a waveform and sprite for a file, unless they are already cached."""
+        if probe_cache.has_visuals(filepath, file_identity(filepath)):
+            return
+        try:
+            waveform, sprite = visuals_executor.submit(
+                compute_visuals,
+                filepath,
+                probe['duration'],
+                package_type == Package.VIDEO,
+                settings.WAVEFORM_PEAKS,
+                settings.WAVEFORM_SAMPLE_RATE,
+                settings.SPRITE_THUMBNAILS).result()
+        except Exception as e:
+            # Reviewers can still play the file.
+            logging.error(f'Unable to compute waveform for {filepath}', exc_info=e)
+            return
+        probe_cache.set_visuals(filepath, waveform, sprite)
+
+    def _inspect_package(self, package_path, archivesspace_data, probe_cache, visuals_executor=None):
+        """Gathers data about a package from the filesystem.
+
+        This method does not touch the database, so it can safely be run in a
+        worker thread.
+
+        Args:
+            package_path (pathlib.Path): root directory of the package.
+            archivesspace_data (tuple): package data as returned by ArchivesSpaceClient.get_package_data.
+            probe_cache (ProbeCache): cache of ffprobe results from earlier runs.
+            visuals_executor (concurrent.futures.Executor): process pool for computing waveforms and sprites.
+
+        Returns:
+            package_data, media_files (tuple): field values for a new Package
+                and unsaved MediaFile objects for its access and master files.
+        """
+        refid = package_path.stem
+        title, av_number, uri, resource_title, resource_uri, undated_object = archivesspace_data
+        package_type = self._get_type(package_path)
+        access_suffix, master_suffix = ('*.mp3', '*.wav') if package_type == Package.AUDIO else ('*.mp4', '*.mkv')
+        access_files = sorted(package_path.glob(access_suffix))
+        master_files = sorted(package_path.glob(master_suffix))
+        probes = probe_files(access_files + master_files, cache=probe_cache)
+        access_probes, master_probes = probes[:len(access_files)], probes[len(access_files):]
+        media_files = [MediaFile(role=MediaFile.ACCESS, **probe) for probe in access_probes] + \
+            [MediaFile(role=MediaFile.MASTER, **probe) for probe in master_probes]
+        if visuals_executor:
+            for filepath, probe in zip(access_files, access_probes):
+                self._compute_visuals(filepath, probe, package_type, probe_cache, visuals_executor)
+        qc_issues = run_all_checks(access_files + master_files, probes)
+        fixity_status, checksums, fixity_errors = check_fixity(package_path)
+        for error in fixity_errors:
+            logging.warning(f'Fixity check failed for {refid}: {error}')
+        package_data = {
+            'title': title,
+            'av_number': av_number,
+            'uri': uri,
+            'resource_title': resource_title,
+            'resource_uri': resource_uri,
+            'duration_access': self._get_duration(access_probes),
+            'duration_master': self._get_duration(master_probes),
+            'multiple_masters': self._has_multiple_masters(master_probes),
+            'refid': refid,
+            'type': package_type,
+            'tree': list_files(package_path),
+            'undated_object': undated_object,
+            'fixity_status': fixity_status,
+            'fixity_errors': fixity_errors,
+            'checksums': checksums,
+            'qc_issues': qc_issues,
+            'qc_issue_count': len(qc_issues),
+        }
+        return package_data, media_files
+
+    def _generate_proxy(self, package_path, package_type):
+        refid = package_path.stem
+        extension = 'mp3' if package_type == Package.AUDIO else 'mp4'
+        return generate_proxy(package_path / f'{refid}.{extension}', refid, package_type, hls=settings.PROXY_HLS)
+
+    def _get_package_paths(self, full=False, quiescence=None):
+        """Returns package directories which need to be processed.
+
+        Directories for pending packages are skipped, as are directories which
+        have not changed since the last run, unless they were last scanned
+        longer than DISCOVERY_RESCAN_MINUTES ago or a full scan is requested.
+        Directories which are still being delivered are checked again on
+        every run, and a failure is reported once if one has not been ready
+        for DISCOVERY_UNREADY_ALERT_HOURS.
+
+        Args:
+            full (bool): ignore snapshots from earlier runs.
+            quiescence (float): seconds a package must have been unchanged.
+
+        Returns:
+            package_paths (dict): signatures of changed directories, keyed by path.
+        """
+        quiescence = settings.DISCOVERY_QUIESCENCE_SECONDS if quiescence is None else quiescence
+        pending_refids = set(Package.objects.filter(process_status=Package.PENDING).values_list('refid', flat=True))
+        snapshots = {snapshot.name: snapshot for snapshot in DirectorySnapshot.objects.all()}
+        rescan_before = timezone.now() - timedelta(minutes=settings.DISCOVERY_RESCAN_MINUTES)
+        package_paths = {}
+        present = []
+        for package_path in settings.BASE_STORAGE_DIR.iterdir():
+            present.append(package_path.name)
+            if package_path.stem in pending_refids:
+                continue
+            signature = directory_signature(package_path)
+            snapshot = snapshots.get(package_path.name)
+            if not full and snapshot and snapshot.unready_since is None and snapshot.matches(signature) and snapshot.last_scanned > rescan_before:
+                continue
+            unready_reason = get_unready_reason(package_path, signature, quiescence)
+            if unready_reason:
+                logging.info(f'Skipping {package_path.name}, which is not ready: {unready_reason}')
+                self._record_unready(package_path, signature, snapshot, unready_reason)
+                continue
+            package_paths[package_path] = signature
+        DirectorySnapshot.objects.exclude(name__in=present).delete()
+        return package_paths
+
+    def _report_failure(self, refid, exception):
+        logging.exception(exception, exc_info=exception)
+        formatted_exception = "\n".join(traceback.format_exception(exception))
+        sns_client = AWSClient('sns', settings.AWS['role_arn'])
+        sns_client.deliver_message(
+            settings.AWS['sns_topic'],
+            None,
+            f'Error discovering refid {refid}\n\n{formatted_exception}',
+            'FAILURE')
+
+    def _record_unready(self, package_path, signature, snapshot, reason):
+        """Records when a directory was first seen not ready, and reports it once it has stayed that way too long."""
+        now = timezone.now()
+        if not snapshot or snapshot.unready_since is None:
+            DirectorySnapshot.objects.update_or_create(
+                name=package_path.name,
+                defaults={**signature, 'unready_since': now, 'unready_reported': False})
+        elif not snapshot.unready_reported and snapshot.unready_since < now - timedelta(hours=settings.DISCOVERY_UNREADY_ALERT_HOURS):
+            self._report_failure(
+                package_path.stem,
+                Exception(f'Package has not been ready since {snapshot.unready_since.isoformat()}: {reason}'))
+            DirectorySnapshot.objects.filter(pk=snapshot.pk).update(unready_reported=True)
+
+    def _save_snapshot(self, package_path, signature):
+        DirectorySnapshot.objects.update_or_create(
+            name=package_path.name,
+            defaults={**signature, 'last_scanned': timezone.now(), 'unready_since': None, 'unready_reported': False})
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.DISCOVERY_WORKERS,
+            help='Number of packages to process concurrently.')
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Process every package directory, ignoring snapshots from earlier runs.')
+        parser.add_argument(
+            '--quiescence',
+            type=float,
+            default=settings.DISCOVERY_QUIESCENCE_SECONDS,
+            help='Seconds a package must be unchanged before it is processed.')
 
     def handle(self, *args, **options):
+        self.ran = False
         if not settings.BASE_STORAGE_DIR.is_dir():
             self.stdout.write(self.style.ERROR(f'Root directory {str(settings.BASE_STORAGE_DIR)} for files waiting to be QCed does not exist.'))
             exit()
+        # Runs from cron and watch_packages would otherwise hash, decode and
+        # transcode the same packages at the same time.
+        with open(settings.DISCOVERY_LOCK_FILE, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.stdout.write(self.style.WARNING('Discovery is already running.'))
+                return
+            self.discover(options)
+            self.ran = True
+
+    def discover(self, options):
+        """Creates packages for new package directories."""
         created_list = []
-        configuration = get_config(f"/{getenv('ENV')}/{getenv('APP_CONFIG_PATH')}")
+        package_paths = self._get_package_paths(options.get('full', False), options.get('quiescence'))
+        if not package_paths:
+            self.stdout.write(self.style.SUCCESS('No new packages to discover.'))
+            return
 
-        client = ArchivesSpaceClient(
-            baseurl=configuration.get('AS_BASEURL'),
-            username=configuration.get('AS_USERNAME'),
-            password=configuration.get('AS_PASSWORD'),
-            repository=configuration.get('AS_REPO'))
-        for package_path in settings.BASE_STORAGE_DIR.iterdir():
-            refid = package_path.stem
-            if not Package.objects.filter(refid=refid, process_status=Package.PENDING).exists():
+        client = get_archivesspace_client()
+        try:
+            archivesspace_data = client.get_packages_data([package_path.stem for package_path in package_paths])
+        except Exception as e:
+            # ArchivesSpace is unavailable, so no snapshots are saved and every
+            # package is retried on the next run.
+            for package_path in package_paths:
+                self._report_failure(package_path.stem, e)
+            return
+
+        probe_cache = ProbeCache(settings.BASE_STORAGE_DIR)
+        approved_refids = set(Package.objects.filter(
+            refid__in=[package_path.stem for package_path in package_paths],
+            process_status=Package.APPROVED).values_list('refid', flat=True))
+
+        # Slow per-package work runs in the pool, while database writes happen
+        # here as each package finishes, so one slow or failing package does
+        # not hold up the rest. Proxies are transcoded in a separate, smaller
+        # pool so that ffmpeg does not compete with discovery of the remaining
+        # packages. Waveforms are computed in processes, which are only
+        # started when needed and are spawned rather than forked so that they
+        # do not inherit locks held by other threads.
+        proxy_futures = {}
+        with ProcessPoolExecutor(max_workers=settings.VISUALS_WORKERS, mp_context=get_context('spawn')) as visuals_executor, \
+                ThreadPoolExecutor(max_workers=settings.PROXY_WORKERS) as proxy_executor, \
+                ThreadPoolExecutor(max_workers=options.get('workers', settings.DISCOVERY_WORKERS)) as executor:
+            futures = {}
+            for package_path in package_paths:
+                refid = package_path.stem
+                if refid in archivesspace_data:
+                    futures[executor.submit(
+                        self._inspect_package,
+                        package_path,
+                        archivesspace_data[refid],
+                        probe_cache,
+                        visuals_executor if settings.VISUALS_ENABLED else None)] = package_path
+                else:
+                    self._report_failure(refid, Exception(f'Expecting to get one result for ref id {refid} but got none instead.'))
+                    self._save_snapshot(package_path, package_paths[package_path])
+            for future in as_completed(futures):
+                package_path = futures[future]
+                refid = package_path.stem
                 try:
-                    title, av_number, uri, resource_title, resource_uri, undated_object = client.get_package_data(refid)
-                    package_type = self._get_type(package_path)
-                    package_tree = self._get_dir_tree(package_path)
-                    possible_duplicate = Package.objects.filter(refid=refid, process_status=Package.APPROVED).exists()
-                    access_suffix, master_suffix = ('*.mp3', '*.wav') if package_type == Package.AUDIO else ('*.mp4', '*.mkv')
-                    Package.objects.create(
-                        title=title,
-                        av_number=av_number,
-                        uri=uri,
-                        resource_title=resource_title,
-                        resource_uri=resource_uri,
-                        duration_access=self._get_duration(package_path.glob(access_suffix)),
-                        duration_master=self._get_duration(package_path.glob(master_suffix)),
-                        multiple_masters=self._has_multiple_masters(package_path.glob(master_suffix)),
-                        possible_duplicate=possible_duplicate,
-                        refid=refid,
-                        type=package_type,
-                        tree=package_tree,
-                        undated_object=undated_object,
-                        process_status=Package.PENDING)
+                    package_data, media_files = future.result()
+                    with transaction.atomic():
+                        package = Package.objects.create(
+                            **package_data,
+                            possible_duplicate=refid in approved_refids,
+                            process_status=Package.PENDING)
+                        for media_file in media_files:
+                            media_file.package = package
+                        MediaFile.objects.bulk_create(media_files)
                     created_list.append(refid)
+                    if settings.PROXY_ENABLED:
+                        proxy_futures[proxy_executor.submit(self._generate_proxy, package_path, package.type)] = refid
+                except IntegrityError:
+                    # Another discovery run created this package first.
+                    logging.info(f'Package {refid} is already waiting to be reviewed')
+                except Exception as e:
+                    self._report_failure(refid, e)
+                finally:
+                    probe_cache.save()
+                    self._save_snapshot(package_path, package_paths[package_path])
+            for future in as_completed(proxy_futures):
+                try:
+                    future.result()
                 except Exception as e:
-                    logging.exception(e)
-                    exception = "\n".join(traceback.format_exception(e))
-                    sns_client = AWSClient('sns', settings.AWS['role_arn'])
-                    sns_client.deliver_message(
-                        settings.AWS['sns_topic'],
-                        None,
-                        f'Error discovering refid {refid}\n\n{exception}',
-                        'FAILURE')
-                    continue
+                    # Reviewers can still play the original access file.
+                    logging.error(f'Unable to generate proxy for {proxy_futures[future]}', exc_info=e)
+        evict_stale_cache_entries()
+        if settings.PROXY_ENABLED:
+            evict_proxies(set(Package.objects.filter(process_status=Package.PENDING).values_list('refid', flat=True)))
 
         message = f'Packages created: {", ".join(created_list)}' if len(created_list) else 'No new packages to discover.'
         self.stdout.write(self.style.SUCCESS(message))
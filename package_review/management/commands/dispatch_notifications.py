@@ -0,0 +1,76 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from package_review.clients import AWSClient
+from package_review.models import OutboxMessage
+
+
+class Command(BaseCommand):
+    help = "Delivers queued notifications to SNS"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.OUTBOX_BATCH_SIZE,
+            help='Maximum number of notifications to dispatch at once.')
+
+    def get_queryset(self):
+        """Returns undelivered messages which are due to be attempted."""
+        return OutboxMessage.objects.filter(
+            sent__isnull=True,
+            attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+            next_attempt__lte=timezone.now()).select_related('package').order_by('created')
+
+    def give_up(self, outbox_message):
+        """Reports a message which will not be attempted again, so that it is not lost unnoticed."""
+        refid = outbox_message.package.refid if outbox_message.package else None
+        logging.error(
+            f'Giving up on notification {outbox_message.pk} for package {refid} after {outbox_message.attempts} attempts: '
+            f'{outbox_message.outcome} {outbox_message.message}')
+
+    def dispatch(self, aws_client, batch_size):
+        """Delivers one batch of messages and records the outcome.
+
+        Rows are locked while they are delivered, so overlapping runs skip
+        messages which are already being sent.
+
+        Returns:
+            sent, failed (tuple of ints): number of messages delivered and not delivered.
+        """
+        with transaction.atomic():
+            batch = list(self.get_queryset().select_for_update(skip_locked=True, of=('self',))[:batch_size])
+            if not batch:
+                return 0, 0
+            messages = [(m.package, m.message, m.outcome, m.rights_ids) for m in batch]
+            undelivered = {id(m) for m in aws_client.deliver_messages(settings.AWS['sns_topic'], messages, max_attempts=1)}
+            now = timezone.now()
+            for outbox_message, message in zip(batch, messages):
+                outbox_message.attempts += 1
+                if id(message) in undelivered:
+                    outbox_message.next_attempt = now + timedelta(seconds=settings.OUTBOX_BACKOFF_SECONDS * 2 ** (outbox_message.attempts - 1))
+                    if outbox_message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                        self.give_up(outbox_message)
+                else:
+                    outbox_message.sent = now
+            OutboxMessage.objects.bulk_update(batch, ['attempts', 'next_attempt', 'sent'])
+        return len(batch) - len(undelivered), len(undelivered)
+
+    def handle(self, *args, **options):
+        if not self.get_queryset().exists():
+            self.stdout.write(self.style.SUCCESS('No notifications to dispatch.'))
+            return
+        aws_client = AWSClient('sns', settings.AWS['role_arn'])
+        sent_count = failed_count = 0
+        while True:
+            sent, failed = self.dispatch(aws_client, options['batch_size'])
+            if not sent and not failed:
+                break
+            sent_count += sent
+            failed_count += failed
+        self.stdout.write(self.style.SUCCESS(f'Notifications dispatched: {sent_count}, failed: {failed_count}'))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from package_review.models import Package
+from package_review.views import PackageListView
+
+
+class Command(BaseCommand):
+    help = "Prints database query plans for frequently run package queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Execute the queries and report actual timings, where the database supports it.')
+
+    def get_queries(self):
+        """Returns the querysets run by discovery and the package list.
+
+        Package list queries are built from the view's own queryset, ordered
+        and limited as the first page of each sort is.
+        """
+        refid = Package.objects.values_list('refid', flat=True).first() or ''
+        page_size = settings.PACKAGE_LIST_PAGE_SIZE + 1
+        list_queryset = PackageListView.queryset
+        return {
+            'Pending refids': Package.objects.filter(process_status=Package.PENDING).values_list('refid', flat=True),
+            'Pending package': Package.objects.filter(refid=refid, process_status=Package.PENDING),
+            'Approved duplicates': Package.objects.filter(refid__in=[refid], process_status=Package.APPROVED).values_list('refid', flat=True),
+            'Package list': list_queryset.order_by('av_number_sort', 'pk')[:page_size],
+            'Package list by title': list_queryset.order_by('title', 'pk')[:page_size],
+            'Package list by QC issues': list_queryset.order_by('-qc_issue_count', '-pk')[:page_size],
+        }
+
+    def handle(self, *args, **options):
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        for name, queryset in self.get_queries().items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(**explain_options))
@@ -0,0 +1,109 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from package_review.models import OutboxMessage, Package, PackageJob
+from package_review.storage import delete_package, move_package
+
+ACTIONS = {
+    PackageJob.APPROVE: (move_package, Package.APPROVED, 'Package reviewed and approved.', 'SUCCESS'),
+    PackageJob.REJECT: (delete_package, Package.REJECTED, 'Package reviewed and rejected.', 'FAILURE'),
+}
+
+
+class Command(BaseCommand):
+    help = "Processes queued approve and reject jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.JOB_WORKERS,
+            help='Number of jobs to process concurrently.')
+
+    def claim_jobs(self, limit, running=()):
+        """Marks up to `limit` queued jobs as running and returns them.
+
+        Jobs which have been running for longer than JOB_STALE_MINUTES are
+        assumed to belong to a worker which stopped, and are claimed again,
+        unless they are among the jobs this process is still running.
+
+        Args:
+            limit (int): maximum number of jobs to claim.
+            running (iterable of PackageJob): jobs already being run by this process.
+        """
+        now = timezone.now()
+        stale = now - timedelta(minutes=settings.JOB_STALE_MINUTES)
+        with transaction.atomic():
+            jobs = list(
+                PackageJob.objects.filter(Q(status=PackageJob.QUEUED) | Q(status=PackageJob.RUNNING, started__lt=stale))
+                .exclude(pk__in=[job.pk for job in running])
+                .select_related('package')
+                .select_for_update(skip_locked=True, of=('self',))
+                .order_by('created')[:limit])
+            for job in jobs:
+                job.status = PackageJob.RUNNING
+                job.started = now
+            PackageJob.objects.bulk_update(jobs, ['status', 'started'])
+        return jobs
+
+    def run_job(self, job):
+        """Performs the file operations for a job. Runs in a worker thread."""
+        file_operation, *_ = ACTIONS[job.action]
+        if job.action == PackageJob.APPROVE:
+            file_operation(job.package.refid, checksums=job.package.checksums)
+        else:
+            file_operation(job.package.refid)
+
+    def complete_job(self, job):
+        """Updates the package and queues a notification once its files have been handled."""
+        _, process_status, message, outcome = ACTIONS[job.action]
+        package = job.package
+        with transaction.atomic():
+            package.process_status = process_status
+            if job.action == PackageJob.APPROVE:
+                package.rights_ids = job.rights_ids
+            package.save(update_fields=['process_status', 'rights_ids'])
+            OutboxMessage.objects.create(
+                package=package,
+                message=message,
+                outcome=outcome,
+                rights_ids=job.rights_ids)
+            job.status = PackageJob.COMPLETE
+            job.finished = timezone.now()
+            job.save()
+
+    def fail_job(self, job, exception):
+        logging.error(f'{job.get_action_display()} failed for {job.package.refid}', exc_info=exception)
+        job.status = PackageJob.FAILED
+        job.error = str(exception)
+        job.finished = timezone.now()
+        job.save()
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        completed = failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            while True:
+                for job in self.claim_jobs(workers - len(futures), futures.values()):
+                    futures[executor.submit(self.run_job, job)] = job
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures.pop(future)
+                    try:
+                        future.result()
+                        self.complete_job(job)
+                        completed += 1
+                    except Exception as e:
+                        self.fail_job(job, e)
+                        failed += 1
+        self.stdout.write(self.style.SUCCESS(f'Jobs completed: {completed}, failed: {failed}'))
@@ -0,0 +1,99 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from package_review.management.commands import discover_packages
+from package_review.watchers import get_watcher
+
+
+class Command(BaseCommand):
+    help = "Watches for new packages and discovers them once they stop changing."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--debounce',
+            type=float,
+            default=settings.WATCH_DEBOUNCE_SECONDS,
+            help='Seconds a package must be unchanged before it is discovered.')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.WATCH_POLL_INTERVAL_SECONDS,
+            help='Seconds between scans when inotify is not available.')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.DISCOVERY_WORKERS,
+            help='Number of packages to process concurrently.')
+
+    def discover(self):
+        """Runs discovery.
+
+        Returns:
+            ran (bool): False if discovery did not finish, for example because
+                another run held the discovery lock.
+        """
+        command = discover_packages.Command()
+        try:
+            # Packages the watcher has seen settle have been unchanged for at
+            # least the debounce period, so there is no need to wait longer.
+            call_command(command, workers=self.workers, quiescence=self.debounce, stdout=self.stdout, stderr=self.stderr)
+        except Exception as e:
+            logging.exception(e)
+        return getattr(command, 'ran', False)
+
+    def check_empty(self):
+        """Sends a completion message when the storage directory becomes empty."""
+        is_empty = not any(settings.BASE_STORAGE_DIR.iterdir())
+        if is_empty and not self.is_empty:
+            try:
+                call_command('check_qc_status', stdout=self.stdout, stderr=self.stderr)
+            except Exception as e:
+                logging.exception(e)
+        self.is_empty = is_empty
+
+    def tick(self, changed_paths, now=None):
+        """Records changes and processes packages which have settled.
+
+        Args:
+            changed_paths (set of pathlib.Path): package directories which changed.
+            now (float): current monotonic time.
+        """
+        now = time.monotonic() if now is None else now
+        for package_path in changed_paths:
+            self.last_changes[package_path] = now
+        settled = [package_path for package_path, changed in self.last_changes.items() if now - changed >= self.debounce]
+        if any(package_path.exists() for package_path in settled) and not self.discover():
+            # Try again once another debounce period has passed.
+            for package_path in settled:
+                self.last_changes[package_path] = now
+            return
+        for package_path in settled:
+            del self.last_changes[package_path]
+        if settled:
+            self.check_empty()
+
+    def handle(self, *args, **options):
+        if not settings.BASE_STORAGE_DIR.is_dir():
+            self.stdout.write(self.style.ERROR(f'Root directory {str(settings.BASE_STORAGE_DIR)} for files waiting to be QCed does not exist.'))
+            exit()
+        self.debounce = options.get('debounce', settings.WATCH_DEBOUNCE_SECONDS)
+        self.workers = options.get('workers', settings.DISCOVERY_WORKERS)
+        self.last_changes = {}
+        self.is_empty = None
+
+        watcher = get_watcher(settings.BASE_STORAGE_DIR, options.get('poll_interval', settings.WATCH_POLL_INTERVAL_SECONDS))
+        self.stdout.write(self.style.SUCCESS(f'Watching {str(settings.BASE_STORAGE_DIR)} with {watcher.__class__.__name__}'))
+        # Pick up anything delivered while the watcher was not running.
+        self.discover()
+        self.check_empty()
+        try:
+            while True:
+                self.tick(watcher.wait(timeout=1))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Stopped watching.'))
+        finally:
+            watcher.close()
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import (BooleanField, CharField, ExpressionWrapper, Q,
+                              Value)
+from django.db.models.functions import Concat
+from django.utils import timezone
+
+from .models import MediaCache, MediaFile, Package
+
+PARTIAL_HASH_BYTES = 1024 * 1024
+PROBE_ENTRIES = 'format=format_name,duration,bit_rate:stream=codec_type,codec_name,bit_rate,sample_rate,channels,width,height'
+
+
+def _to_number(value, number_type):
+    """Casts an ffprobe value to a number, returning None if not available."""
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_file(filepath):
+    """Runs ffprobe once against a file and parses technical metadata.
+
+    Args:
+        filepath (pathlib.Path): path to an audio or video file.
+
+    Returns:
+        probe (dict): filename, duration, format, bitrate, codec, sample rate and resolution data.
+    """
+    process = subprocess.run(
+        ['ffprobe',
+         '-v',
+         'error',
+         '-show_entries',
+         PROBE_ENTRIES,
+         '-of',
+         'json',
+         str(filepath)],
+        capture_output=True,
+        check=True)
+    data = json.loads(process.stdout)
+    file_format = data.get('format', {})
+    streams = data.get('streams', [])
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    return {
+        'filename': filepath.name,
+        'format_name': file_format.get('format_name'),
+        'duration': float(file_format['duration']),
+        'bit_rate': _to_number(file_format.get('bit_rate'), int),
+        'audio_codec': audio.get('codec_name'),
+        'sample_rate': _to_number(audio.get('sample_rate'), int),
+        'channels': _to_number(audio.get('channels'), int),
+        'video_codec': video.get('codec_name'),
+        'width': _to_number(video.get('width'), int),
+        'height': _to_number(video.get('height'), int),
+    }
+
+
+def partial_hash(filepath, size):
+    """Hashes the size and the first and last megabyte of a file.
+
+    This is much cheaper than hashing multi-gigabyte files in full, but still
+    catches files which were replaced with preserved size and timestamps.
+    """
+    digest = hashlib.blake2b(str(size).encode())
+    with open(filepath, 'rb') as f:
+        digest.update(f.read(PARTIAL_HASH_BYTES))
+        if size > PARTIAL_HASH_BYTES:
+            f.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+            digest.update(f.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def file_identity(filepath):
+    """Returns values which change whenever a file on disk changes.
+
+    Args:
+        filepath (pathlib.Path): path to a file.
+
+    Returns:
+        identity (dict): size, mtime_ns, inode and (if PROBE_CACHE_PARTIAL_HASH is set) partial_hash.
+    """
+    stat = filepath.stat()
+    identity = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+    if settings.PROBE_CACHE_PARTIAL_HASH:
+        identity['partial_hash'] = partial_hash(filepath, stat.st_size)
+    return identity
+
+
+class ProbeCache(object):
+    """Cache of probe results, waveforms and sprites for files under a root directory.
+
+    Entries are loaded with a single query when the cache is created, so that
+    lookups from worker threads never touch the database. Waveforms and
+    sprites are not loaded, only whether they exist. New and reused entries
+    are written back by `save`, which must be called from the thread which
+    created the cache.
+    """
+
+    def __init__(self, root_path):
+        queryset = MediaCache.objects.filter(path__startswith=str(root_path)).defer('waveform', 'sprite').annotate(
+            has_visuals=ExpressionWrapper(Q(waveform__isnull=False), output_field=BooleanField()))
+        self.entries = {entry.path: entry for entry in queryset}
+        self.changed = {}
+        self.used = set()
+        self.lock = threading.Lock()
+
+    def get(self, filepath, identity):
+        """Returns cached probe data for a file, or None if the file has changed."""
+        entry = self.entries.get(str(filepath))
+        if entry and entry.matches(identity):
+            with self.lock:
+                self.used.add(entry.path)
+            return entry.probe
+
+    def set(self, filepath, identity, probe):
+        """Records probe data for a file."""
+        entry = MediaCache(path=str(filepath), probe=probe, **identity)
+        entry.has_visuals = False
+        with self.lock:
+            self.entries[entry.path] = entry
+            self.changed[entry.path] = entry
+
+    def has_visuals(self, filepath, identity):
+        """Returns True if a waveform has been computed for the current version of a file."""
+        entry = self.entries.get(str(filepath))
+        return bool(entry and entry.matches(identity) and entry.has_visuals)
+
+    def set_visuals(self, filepath, waveform, sprite):
+        """Records a waveform and sprite for a file which has already been probed."""
+        with self.lock:
+            entry = self.entries.get(str(filepath))
+            if entry is None:
+                return
+            entry.waveform, entry.sprite, entry.has_visuals = waveform, sprite, True
+            self.changed[entry.path] = entry
+
+    def save(self):
+        """Writes new and updated entries and refreshes last_used for entries that were read."""
+        with self.lock:
+            changed, self.changed = list(self.changed.values()), {}
+            used, self.used = self.used - {entry.path for entry in changed}, set()
+        now = timezone.now()
+        for entry in changed:
+            entry.last_used = now
+        MediaCache.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=['path'],
+            update_fields=['size', 'mtime_ns', 'inode', 'partial_hash', 'probe', 'waveform', 'sprite', 'last_used'])
+        if used:
+            MediaCache.objects.filter(path__in=used).update(last_used=now)
+
+
+def evict_stale_cache_entries(max_age_days=None):
+    """Deletes cache entries which have not been used recently.
+
+    Entries for files of packages which are still waiting to be reviewed
+    are kept however old they are, since their waveforms and sprites are
+    shown on the detail page. Discovery skips pending packages, so those
+    entries are not refreshed.
+
+    Returns:
+        count (int): number of entries deleted.
+    """
+    max_age = timedelta(days=max_age_days or settings.PROBE_CACHE_MAX_AGE_DAYS)
+    pending_paths = MediaFile.objects.filter(package__process_status=Package.PENDING).annotate(
+        path=Concat(Value(f'{settings.BASE_STORAGE_DIR}/'), 'package__refid', Value('/'), 'filename',
+                    output_field=CharField())).values('path')
+    count, _ = MediaCache.objects.filter(last_used__lt=timezone.now() - max_age).exclude(path__in=pending_paths).delete()
+    return count
+
+
+def _probe_with_cache(filepath, cache):
+    """Returns cached probe data for a file, probing it if necessary."""
+    identity = file_identity(filepath)
+    probe = cache.get(filepath, identity)
+    if probe is None:
+        probe = probe_file(filepath)
+        cache.set(filepath, identity, probe)
+    return probe
+
+
+def probe_files(filepaths, max_workers=None, cache=None):
+    """Probes a list of files concurrently.
+
+    Args:
+        filepaths (list of pathlib.Path): files to probe.
+        max_workers (int): maximum number of concurrent ffprobe processes.
+        cache (ProbeCache): optional cache of results from earlier runs.
+
+    Returns:
+        probes (list of dicts): probe results in the same order as filepaths.
+    """
+    if not filepaths:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or settings.PROBE_WORKERS) as executor:
+        if cache is None:
+            return list(executor.map(probe_file, filepaths))
+        return list(executor.map(lambda fp: _probe_with_cache(fp, cache), filepaths))
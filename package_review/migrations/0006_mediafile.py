@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0005_package_undated_object'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=255)),
+                ('role', models.IntegerField(choices=[(1, 'Access'), (2, 'Master')])),
+                ('format_name', models.CharField(blank=True, max_length=255, null=True)),
+                ('duration', models.FloatField()),
+                ('bit_rate', models.BigIntegerField(blank=True, null=True)),
+                ('audio_codec', models.CharField(blank=True, max_length=50, null=True)),
+                ('sample_rate', models.IntegerField(blank=True, null=True)),
+                ('channels', models.IntegerField(blank=True, null=True)),
+                ('video_codec', models.CharField(blank=True, max_length=50, null=True)),
+                ('width', models.IntegerField(blank=True, null=True)),
+                ('height', models.IntegerField(blank=True, null=True)),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_files', to='package_review.package')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0006_mediafile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, unique=True)),
+                ('size', models.BigIntegerField()),
+                ('mtime_ns', models.BigIntegerField()),
+                ('inode', models.BigIntegerField()),
+                ('partial_hash', models.CharField(blank=True, max_length=128, null=True)),
+                ('probe', models.JSONField()),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
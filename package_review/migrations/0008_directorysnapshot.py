@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:14
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0007_mediacache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('mtime_ns', models.BigIntegerField()),
+                ('size', models.BigIntegerField()),
+                ('last_scanned', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
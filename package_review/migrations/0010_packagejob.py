@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0009_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.IntegerField(choices=[(1, 'Approve'), (2, 'Reject')])),
+                ('status', models.IntegerField(choices=[(0, 'Queued'), (1, 'Running'), (2, 'Complete'), (3, 'Failed')], default=0)),
+                ('rights_ids', models.CharField(blank=True, max_length=100, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='package_review.package')),
+            ],
+        ),
+    ]
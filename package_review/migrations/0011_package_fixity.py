@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0010_packagejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='checksums',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='fixity_errors',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='fixity_status',
+            field=models.IntegerField(choices=[(0, 'No manifest'), (1, 'Valid'), (2, 'Invalid')], default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0011_package_fixity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediacache',
+            name='sprite',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediacache',
+            name='waveform',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
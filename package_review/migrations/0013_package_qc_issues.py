@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0012_mediacache_visuals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='qc_issue_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='package',
+            name='qc_issues',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:38
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+PENDING = 0
+
+
+def remove_duplicate_pending_packages(apps, schema_editor):
+    """Keeps only the most recently discovered pending package for each refid.
+
+    Duplicates describe the same directory on disk, so the older rows are
+    deleted before the unique constraint is added.
+    """
+    Package = apps.get_model('package_review', 'Package')
+    duplicates = (Package.objects.filter(process_status=PENDING)
+                  .values('refid')
+                  .annotate(count=Count('id'), latest=Max('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        Package.objects.filter(
+            refid=duplicate['refid'],
+            process_status=PENDING).exclude(id=duplicate['latest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0013_package_qc_issues'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(fields=['refid', 'process_status'], name='package_refid_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(condition=models.Q(('process_status', 0)), fields=['id'], name='package_pending_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_pending_packages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='package',
+            constraint=models.UniqueConstraint(condition=models.Q(('process_status', 0)), fields=('refid',), name='unique_pending_refid'),
+        ),
+    ]
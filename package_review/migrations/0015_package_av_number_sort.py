@@ -0,0 +1,48 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:39
+
+import re
+
+from django.db import migrations, models
+
+
+def get_av_number_sort(av_number):
+    """Copy of models.get_av_number_sort as it was when this migration was written."""
+    digits = re.search(r'(\d+)\D*$', av_number or '')
+    return min(int(digits.group(1)), 2 ** 63 - 1) if digits else 0
+
+
+def populate_av_number_sort(apps, schema_editor):
+    Package = apps.get_model('package_review', 'Package')
+    packages = []
+    for package in Package.objects.only('id', 'av_number').iterator(chunk_size=1000):
+        package.av_number_sort = get_av_number_sort(package.av_number)
+        packages.append(package)
+    Package.objects.bulk_update(packages, ['av_number_sort'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0014_package_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='av_number_sort',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_av_number_sort, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(condition=models.Q(('process_status', 0)), fields=['av_number_sort', 'id'], name='package_pending_av_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(condition=models.Q(('process_status', 0)), fields=['title', 'id'], name='package_pending_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='package',
+            index=models.Index(condition=models.Q(('process_status', 0)), fields=['qc_issue_count', 'id'], name='package_pending_qc_issues_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+class AddPostgresIndex(migrations.AddIndex):
+    """Adds an index which is only supported by PostgreSQL.
+
+    Other databases, such as the SQLite database used in development, fall
+    back to searching without the index.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def get_search_vector():
+    """Copy of models.get_search_vector as it was when this migration was written."""
+    titles = SearchVector('title', weight='A', config='english')
+    identifiers = SearchVector('av_number', 'refid', weight='A', config='simple')
+    collection = SearchVector('resource_title', weight='B', config='english')
+    return titles + identifiers + collection
+
+
+def populate_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        Package = apps.get_model('package_review', 'Package')
+        Package.objects.update(search_vector=get_search_vector())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0015_package_av_number_sort'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='package',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_search_vector, migrations.RunPython.noop),
+        AddPostgresIndex(
+            model_name='package',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='package_search_idx'),
+        ),
+    ]
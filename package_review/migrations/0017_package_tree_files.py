@@ -0,0 +1,49 @@
+# Generated by Django 5.1.1 on 2026-10-17 20:44
+
+from django.db import migrations
+
+CONNECTORS = ('├── ', '└── ')
+
+
+def parse_tree(tree):
+    """Converts the text rendering of a package produced by directory_tree into a list of files.
+
+    Sizes were not recorded in the text rendering, so they are left empty.
+    """
+    files = []
+    directories = []
+    for line in tree.splitlines()[1:]:
+        for connector in CONNECTORS:
+            if connector in line:
+                prefix, name = line.split(connector, 1)
+                break
+        else:
+            continue
+        depth = len(prefix) // 4
+        directories = directories[:depth]
+        if name.endswith('/'):
+            directories.append(name.rstrip('/'))
+        else:
+            files.append({'path': '/'.join(directories + [name]), 'size': None})
+    return sorted(files, key=lambda file: file['path'])
+
+
+def convert_trees(apps, schema_editor):
+    Package = apps.get_model('package_review', 'Package')
+    packages = []
+    for package in Package.objects.filter(tree__isnull=False).only('id', 'tree').iterator(chunk_size=500):
+        if isinstance(package.tree, str):
+            package.tree = parse_tree(package.tree)
+            packages.append(package)
+    Package.objects.bulk_update(packages, ['tree'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0016_package_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(convert_trees, migrations.RunPython.noop),
+    ]
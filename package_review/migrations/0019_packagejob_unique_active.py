@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-17 21:10
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.utils import timezone
+
+ACTIVE_STATUSES = [0, 1]
+FAILED = 3
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """Keeps only the earliest active job for each package, marking the others as failed."""
+    PackageJob = apps.get_model('package_review', 'PackageJob')
+    duplicates = (PackageJob.objects.filter(status__in=ACTIVE_STATUSES)
+                  .values('package')
+                  .annotate(count=Count('id'), first=Min('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        PackageJob.objects.filter(
+            package=duplicate['package'],
+            status__in=ACTIVE_STATUSES).exclude(id=duplicate['first']).update(
+                status=FAILED, error='Another job for this package was already in progress.', finished=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0018_bulkaction'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='packagejob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', [0, 1])), fields=('package',), name='unique_active_package_job'),
+        ),
+    ]
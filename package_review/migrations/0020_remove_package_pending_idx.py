@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-17 21:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0019_packagejob_unique_active'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='package',
+            name='package_pending_idx',
+        ),
+    ]
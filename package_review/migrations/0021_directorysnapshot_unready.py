@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package_review', '0020_remove_package_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directorysnapshot',
+            name='unready_reported',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='directorysnapshot',
+            name='unready_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,31 @@
-from django.db import models
+import re
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import connection, models
+from django.utils import timezone
+
+
+def get_av_number_sort(av_number):
+    """Returns the number at the end of an AV number, or 0 if there is none.
+
+    Args:
+        av_number (str): AV number, for example `AV 1234`.
+    """
+    digits = re.search(r'(\d+)\D*$', av_number or '')
+    return min(int(digits.group(1)), 2 ** 63 - 1) if digits else 0
+
+
+def get_search_vector():
+    """Returns an expression for the full-text search document of a package.
+
+    Titles are stemmed, while AV numbers and refids are indexed as they are.
+    """
+    titles = SearchVector('title', weight='A', config='english')
+    identifiers = SearchVector('av_number', 'refid', weight='A', config='simple')
+    collection = SearchVector('resource_title', weight='B', config='english')
+    return titles + identifiers + collection
 
 
 class Package(models.Model):
@@ -17,8 +44,19 @@ class Package(models.Model):
         (APPROVED, 'Approved'),
         (REJECTED, 'Rejected'))
 
+    FIXITY_UNVERIFIED = 0
+    FIXITY_VALID = 1
+    FIXITY_INVALID = 2
+    FIXITY_STATUS_CHOICES = (
+        (FIXITY_UNVERIFIED, 'No manifest'),
+        (FIXITY_VALID, 'Valid'),
+        (FIXITY_INVALID, 'Invalid'))
+
+    SEARCH_FIELDS = ('title', 'av_number', 'refid', 'resource_title')
+
     title = models.CharField(max_length=255)
     av_number = models.CharField(max_length=255)
+    av_number_sort = models.BigIntegerField(default=0)
     uri = models.CharField(max_length=255)
     resource_title = models.CharField(max_length=255)
     resource_uri = models.CharField(max_length=255)
@@ -32,14 +70,38 @@ class Package(models.Model):
     type = models.IntegerField(choices=TYPE_CHOICES)
     process_status = models.IntegerField(choices=PROCESS_STATUS_CHOICES)
     rights_ids = models.CharField(max_length=100, null=True, blank=True)
+    fixity_status = models.IntegerField(choices=FIXITY_STATUS_CHOICES, default=FIXITY_UNVERIFIED)
+    fixity_errors = models.JSONField(null=True, blank=True)
+    checksums = models.JSONField(null=True, blank=True)
+    qc_issues = models.JSONField(null=True, blank=True)
+    qc_issue_count = models.IntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        # Conditions use the value of PENDING, which is not in scope here.
+        indexes = [
+            models.Index(fields=['refid', 'process_status'], name='package_refid_status_idx'),
+            models.Index(fields=['av_number_sort', 'id'], condition=models.Q(process_status=0), name='package_pending_av_number_idx'),
+            models.Index(fields=['title', 'id'], condition=models.Q(process_status=0), name='package_pending_title_idx'),
+            models.Index(fields=['qc_issue_count', 'id'], condition=models.Q(process_status=0), name='package_pending_qc_issues_idx'),
+            GinIndex(fields=['search_vector'], name='package_search_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['refid'], condition=models.Q(process_status=0), name='unique_pending_refid'),
+        ]
 
     def __str__(self):
         return f'{self.av_number} {self.title}'
 
-    @property
-    def av_number_normalized(self):
-        """Returns a numeric representation of AV number."""
-        return self.av_number.split(' ')[-1]
+    def save(self, *args, **kwargs):
+        """Keeps the stored sort key for AV number in step with AV number."""
+        self.av_number_sort = get_av_number_sort(self.av_number)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'av_number' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'av_number_sort'}
+        super().save(*args, **kwargs)
+        if connection.vendor == 'postgresql' and (update_fields is None or set(update_fields) & set(self.SEARCH_FIELDS)):
+            Package.objects.filter(pk=self.pk).update(search_vector=get_search_vector())
 
     @property
     def archivesspace_link(self):
@@ -49,6 +111,169 @@ class Package(models.Model):
         return f'https://as.rockarch.org/resources/{resource_id}#tree::archival_object_{object_id}'
 
 
+class MediaFile(models.Model):
+    """Technical metadata about an access or master file, as reported by ffprobe."""
+    ACCESS = 1
+    MASTER = 2
+    ROLE_CHOICES = (
+        (ACCESS, 'Access'),
+        (MASTER, 'Master'))
+
+    package = models.ForeignKey(Package, on_delete=models.CASCADE, related_name='media_files')
+    filename = models.CharField(max_length=255)
+    role = models.IntegerField(choices=ROLE_CHOICES)
+    format_name = models.CharField(max_length=255, null=True, blank=True)
+    duration = models.FloatField()
+    bit_rate = models.BigIntegerField(null=True, blank=True)
+    audio_codec = models.CharField(max_length=50, null=True, blank=True)
+    sample_rate = models.IntegerField(null=True, blank=True)
+    channels = models.IntegerField(null=True, blank=True)
+    video_codec = models.CharField(max_length=50, null=True, blank=True)
+    width = models.IntegerField(null=True, blank=True)
+    height = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def path(self):
+        """Returns the path of the file while its package is waiting to be reviewed."""
+        return str(settings.BASE_STORAGE_DIR / self.package.refid / self.filename)
+
+
+class MediaCache(models.Model):
+    """Derived data about a media file, keyed by the identity of the file on disk."""
+
+    path = models.CharField(max_length=1024, unique=True)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    inode = models.BigIntegerField()
+    partial_hash = models.CharField(max_length=128, null=True, blank=True)
+    probe = models.JSONField()
+    waveform = models.BinaryField(null=True, blank=True)
+    sprite = models.BinaryField(null=True, blank=True)
+    last_used = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.path
+
+    def matches(self, identity):
+        """Returns True if the cached file has not changed since it was probed.
+
+        Args:
+            identity (dict): current size, mtime_ns, inode and optional partial_hash of the file.
+        """
+        return all(getattr(self, key) == value for key, value in identity.items())
+
+
+class DirectorySnapshot(models.Model):
+    """State of a package directory when discovery last looked at it."""
+
+    name = models.CharField(max_length=255, unique=True)
+    mtime_ns = models.BigIntegerField()
+    size = models.BigIntegerField()
+    last_scanned = models.DateTimeField(default=timezone.now)
+    unready_since = models.DateTimeField(null=True, blank=True)
+    unready_reported = models.BooleanField(default=False)
+
+    def __str__(self):
+        return self.name
+
+    def matches(self, signature):
+        """Returns True if the directory has not changed since it was scanned.
+
+        Args:
+            signature (dict): current mtime_ns and size of the directory.
+        """
+        return self.mtime_ns == signature['mtime_ns'] and self.size == signature['size']
+
+
+class PackageJob(models.Model):
+    """Approval or rejection of a package, processed by the process_jobs command."""
+    APPROVE = 1
+    REJECT = 2
+    ACTION_CHOICES = (
+        (APPROVE, 'Approve'),
+        (REJECT, 'Reject'))
+
+    QUEUED = 0
+    RUNNING = 1
+    COMPLETE = 2
+    FAILED = 3
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'))
+    ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+    package = models.ForeignKey(Package, on_delete=models.CASCADE, related_name='jobs')
+    bulk_action = models.ForeignKey('BulkAction', on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    action = models.IntegerField(choices=ACTION_CHOICES)
+    status = models.IntegerField(choices=STATUS_CHOICES, default=QUEUED)
+    rights_ids = models.CharField(max_length=100, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # A package can only have one job which is queued or running.
+            models.UniqueConstraint(fields=['package'], condition=models.Q(status__in=[0, 1]), name='unique_active_package_job'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_action_display()} {self.package}'
+
+    @property
+    def is_active(self):
+        return self.status in self.ACTIVE_STATUSES
+
+
+class BulkAction(models.Model):
+    """Jobs queued together by a reviewer, so that their progress can be followed."""
+
+    action = models.IntegerField(choices=PackageJob.ACTION_CHOICES)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.get_action_display()} {self.created}'
+
+    def get_progress(self):
+        """Counts jobs by status.
+
+        Returns:
+            progress (dict): total number of jobs, the number with each status,
+                and whether every job has finished.
+        """
+        progress = self.jobs.aggregate(
+            total=models.Count('id'),
+            **{label.lower(): models.Count('id', filter=models.Q(status=status)) for status, label in PackageJob.STATUS_CHOICES})
+        progress['done'] = not (progress['queued'] or progress['running'])
+        return progress
+
+
+class OutboxMessage(models.Model):
+    """Notification waiting to be delivered to SNS.
+
+    Messages are written in the same transaction as the change they describe
+    and delivered later by the dispatch_notifications command.
+    """
+
+    package = models.ForeignKey(Package, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox_messages')
+    message = models.TextField()
+    outcome = models.CharField(max_length=50)
+    rights_ids = models.CharField(max_length=100, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.outcome} {self.message}'
+
+
 class RightsStatement(models.Model):
     """Rights statement stored in Aquila."""
 
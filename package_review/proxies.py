@@ -0,0 +1,133 @@
+import os
+import subprocess
+import time
+from pathlib import Path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from django.conf import settings
+
+from .models import Package
+
+HLS_SEGMENT_SECONDS = 6
+
+
+def get_proxy_dir(refid):
+    return Path(settings.PROXY_ROOT, refid)
+
+
+def get_proxy_filenames(refid, package_type):
+    """Returns the names of the proxy and HLS playlist for a package."""
+    extension = 'mp3' if package_type == Package.AUDIO else 'mp4'
+    return f'{refid}.{extension}', f'{refid}.m3u8'
+
+
+def _transcode_args(package_type):
+    if package_type == Package.AUDIO:
+        return ['-vn', '-c:a', 'libmp3lame', '-b:a', settings.PROXY_AUDIO_BITRATE]
+    return [
+        '-vf', f"scale=-2:'min({settings.PROXY_VIDEO_HEIGHT},ih)'",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '28',
+        '-c:a', 'aac', '-b:a', settings.PROXY_AUDIO_BITRATE,
+        '-movflags', '+faststart']
+
+
+def _run_ffmpeg(*args):
+    subprocess.run(['ffmpeg', '-nostdin', '-v', 'error', '-y', *[str(arg) for arg in args]], capture_output=True, check=True)
+
+
+def generate_proxy(source, refid, package_type, hls=False):
+    """Transcodes a low-bitrate review copy of an access file.
+
+    Output is written to a temporary directory which is renamed into place
+    once transcoding is complete, so a partially written proxy is never
+    served.
+
+    Args:
+        source (pathlib.Path): access file to transcode.
+        refid (str): ref id of the package.
+        package_type (int): Package.AUDIO or Package.VIDEO.
+        hls (bool): also segment video proxies for HTTP Live Streaming.
+
+    Returns:
+        proxy_dir (pathlib.Path): directory containing the proxy files.
+    """
+    proxy_dir = get_proxy_dir(refid)
+    proxy_dir.parent.mkdir(parents=True, exist_ok=True)
+    proxy_filename, playlist_filename = get_proxy_filenames(refid, package_type)
+    tmp_dir = Path(mkdtemp(prefix=f'.{refid}-', dir=proxy_dir.parent))
+    try:
+        _run_ffmpeg('-i', source, *_transcode_args(package_type), tmp_dir / proxy_filename)
+        if hls and package_type == Package.VIDEO:
+            _run_ffmpeg(
+                '-i', tmp_dir / proxy_filename,
+                '-c', 'copy',
+                '-f', 'hls',
+                '-hls_time', HLS_SEGMENT_SECONDS,
+                '-hls_playlist_type', 'vod',
+                '-hls_segment_filename', tmp_dir / f'{refid}_%05d.ts',
+                tmp_dir / playlist_filename)
+        tmp_dir.chmod(0o755)
+        if proxy_dir.exists():
+            rmtree(proxy_dir)
+        tmp_dir.rename(proxy_dir)
+    except BaseException:
+        rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return proxy_dir
+
+
+def touch_proxy(refid):
+    """Records that a proxy was used, so it is evicted after less recently used proxies."""
+    try:
+        os.utime(get_proxy_dir(refid))
+    except FileNotFoundError:
+        pass
+
+
+def evict_proxies(keep_refids, max_bytes=None):
+    """Deletes proxies which are no longer needed or exceed the cache size.
+
+    Proxies for packages not in keep_refids are always deleted. The least
+    recently used of the remaining proxies are then deleted until the cache
+    fits within max_bytes. Temporary directories left behind by transcodes
+    which were killed are deleted once nothing in them has changed for
+    PROXY_TEMP_MAX_AGE_HOURS.
+
+    Args:
+        keep_refids (set): ref ids of packages which are still being reviewed.
+        max_bytes (int): maximum total size of all proxies.
+
+    Returns:
+        count (int): number of proxies deleted.
+    """
+    max_bytes = settings.PROXY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    root = Path(settings.PROXY_ROOT)
+    if not root.is_dir():
+        return 0
+    stale = time.time() - settings.PROXY_TEMP_MAX_AGE_HOURS * 3600
+    proxies, deleted = [], 0
+    for proxy_dir in root.iterdir():
+        if proxy_dir.name.startswith('.'):
+            try:
+                changed = max(fp.stat().st_mtime for fp in [proxy_dir, *proxy_dir.iterdir()])
+            except FileNotFoundError:
+                # The transcode finished and renamed the directory.
+                continue
+            if changed < stale:
+                rmtree(proxy_dir, ignore_errors=True)
+            continue
+        if proxy_dir.name not in keep_refids:
+            rmtree(proxy_dir)
+            deleted += 1
+            continue
+        size = sum(fp.stat().st_size for fp in proxy_dir.iterdir())
+        proxies.append((proxy_dir.stat().st_mtime_ns, size, proxy_dir))
+    total = sum(size for _, size, _ in proxies)
+    for _, size, proxy_dir in sorted(proxies):
+        if total <= max_bytes:
+            break
+        rmtree(proxy_dir)
+        total -= size
+        deleted += 1
+    return deleted
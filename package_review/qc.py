@@ -0,0 +1,158 @@
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class QCCheck(object):
+    """Base class for automated QC checks.
+
+    Each check contributes an ffmpeg audio or video filter and parses the
+    output of that filter into flagged time ranges. Filters from every check
+    are run in a single ffmpeg process per file, so each file is decoded once
+    however many checks are configured.
+    """
+    name = None
+    audio_filter = None
+    video_filter = None
+
+    def parse(self, output, duration):
+        """Parses ffmpeg output.
+
+        Args:
+            output (str): combined stdout and stderr from ffmpeg.
+            duration (float): duration of the file in seconds.
+
+        Returns:
+            ranges (list of tuples): start time, end time and description of each problem.
+        """
+        raise NotImplementedError
+
+
+class SilenceCheck(QCCheck):
+    """Flags stretches of silence, which may indicate dropouts."""
+    name = 'silence'
+
+    @property
+    def audio_filter(self):
+        return f'silencedetect=noise={settings.QC_SILENCE_THRESHOLD}:d={settings.QC_SILENCE_SECONDS}'
+
+    def parse(self, output, duration):
+        ranges = []
+        start = None
+        for match in re.finditer(r'silence_(start|end): (-?[\d.]+)', output):
+            if match.group(1) == 'start':
+                start = max(float(match.group(2)), 0)
+            elif start is not None:
+                ranges.append((start, float(match.group(2)), 'Silence'))
+                start = None
+        if start is not None:
+            ranges.append((start, duration, 'Silence'))
+        return ranges
+
+
+class BlackFrameCheck(QCCheck):
+    """Flags stretches of black video."""
+    name = 'black'
+
+    @property
+    def video_filter(self):
+        return f'blackdetect=d={settings.QC_BLACK_SECONDS}:pix_th=0.10'
+
+    def parse(self, output, duration):
+        return [(float(start), float(end), 'Black frames')
+                for start, end in re.findall(r'black_start:([\d.]+) black_end:([\d.]+)', output)]
+
+
+class ClippingCheck(QCCheck):
+    """Flags seconds of audio which peak at or above full scale."""
+    name = 'clipping'
+    audio_filter = 'aresample=48000,asetnsamples=n=48000,astats=metadata=1:reset=1,ametadata=print:key=lavfi.astats.Overall.Peak_level:file=-'
+
+    def parse(self, output, duration):
+        ranges = []
+        pts_time = None
+        for line in output.splitlines():
+            if line.startswith('frame:'):
+                match = re.search(r'pts_time:([\d.]+)', line)
+                pts_time = float(match.group(1)) if match else None
+            elif line.startswith('lavfi.astats.Overall.Peak_level=') and pts_time is not None:
+                if float(line.split('=', 1)[1]) >= settings.QC_CLIPPING_DB:
+                    end = min(pts_time + 1, duration)
+                    if ranges and ranges[-1][1] >= pts_time:
+                        ranges[-1] = (ranges[-1][0], end, 'Clipping')
+                    else:
+                        ranges.append((pts_time, end, 'Clipping'))
+        return ranges
+
+
+def get_checks():
+    """Returns instances of the checks listed in the QC_CHECKS setting."""
+    return [import_string(path)() for path in settings.QC_CHECKS]
+
+
+def run_checks(filepath, probe, checks):
+    """Runs QC checks against a file.
+
+    Args:
+        filepath (pathlib.Path): path to an audio or video file.
+        probe (dict): probe results for the file.
+        checks (list of QCCheck): checks to run.
+
+    Returns:
+        issues (list of dicts): check name, filename, start and end of each problem found.
+    """
+    audio_checks = [check for check in checks if check.audio_filter and probe.get('audio_codec')]
+    video_checks = [check for check in checks if check.video_filter and probe.get('video_codec')]
+    if not audio_checks and not video_checks:
+        return []
+    args = ['ffmpeg', '-nostdin', '-hide_banner', '-v', 'info', '-i', str(filepath)]
+    if audio_checks:
+        args += ['-af', ','.join(check.audio_filter for check in audio_checks)]
+    else:
+        args += ['-an']
+    if video_checks:
+        args += ['-vf', ','.join(check.video_filter for check in video_checks)]
+    else:
+        args += ['-vn']
+    process = subprocess.run(args + ['-f', 'null', '-'], capture_output=True, text=True, errors='replace')
+    if process.returncode:
+        # A file ffmpeg cannot decode is itself a problem for reviewers.
+        return [{
+            'check': 'decode',
+            'filename': filepath.name,
+            'start': 0,
+            'end': probe['duration'],
+            'description': 'Unable to decode file'}]
+    output = process.stdout + process.stderr
+    issues = []
+    for check in audio_checks + video_checks:
+        for start, end, description in check.parse(output, probe['duration']):
+            issues.append({
+                'check': check.name,
+                'filename': filepath.name,
+                'start': round(start, 3),
+                'end': round(end, 3),
+                'description': description})
+    return issues
+
+
+def run_all_checks(filepaths, probes, max_workers=None):
+    """Runs QC checks against several files concurrently.
+
+    Args:
+        filepaths (list of pathlib.Path): files to check.
+        probes (list of dicts): probe results for each file.
+        max_workers (int): maximum number of concurrent ffmpeg processes.
+
+    Returns:
+        issues (list of dicts): problems found in all files, ordered by file and start time.
+    """
+    checks = get_checks()
+    if not filepaths or not checks:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or settings.QC_WORKERS) as executor:
+        results = executor.map(lambda args: run_checks(*args, checks), zip(filepaths, probes))
+        return [issue for issues in results for issue in sorted(issues, key=lambda issue: issue['start'])]
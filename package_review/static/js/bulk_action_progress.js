@@ -0,0 +1,32 @@
+document.addEventListener('DOMContentLoaded', function() {
+
+    // Polls progress of bulk approvals and rejections until every item has been processed
+    const pollInterval = 3000;
+
+    function poll(element) {
+        fetch(element.dataset.url, {headers: {'Accept': 'application/json'}})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(response.statusText)
+                }
+                return response.json()
+            })
+            .then(progress => {
+                const processed = progress.complete + progress.failed
+                const bar = element.querySelector('progress')
+                bar.max = progress.total
+                bar.value = processed
+                let status = `${processed} of ${progress.total} items processed`
+                if (progress.failed) {
+                    status += `, ${progress.failed} failed`
+                }
+                element.querySelector('.bulk-action-progress__status').textContent = status
+                if (!progress.done) {
+                    setTimeout(() => poll(element), pollInterval)
+                }
+            })
+            .catch(() => setTimeout(() => poll(element), pollInterval))
+    }
+
+    document.querySelectorAll('.bulk-action-progress').forEach(poll)
+});
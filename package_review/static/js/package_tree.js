@@ -0,0 +1,27 @@
+document.addEventListener('DOMContentLoaded', function() {
+
+    // Package structure is only fetched the first time it is opened
+    const tree = document.getElementById('package-tree');
+
+    function loadTree() {
+        if (!tree.open || tree.dataset.loaded) {
+            return
+        }
+        tree.dataset.loaded = true
+        const files = tree.querySelector('.package-tree__files')
+        fetch(tree.dataset.url)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(response.statusText)
+                }
+                return response.text()
+            })
+            .then(html => { files.innerHTML = html })
+            .catch(() => {
+                delete tree.dataset.loaded
+                files.textContent = 'Unable to load package structure.'
+            })
+    }
+
+    tree && tree.addEventListener('toggle', loadTree)
+});
@@ -0,0 +1,324 @@
+import errno
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from shutil import copystat, rmtree
+
+from django.conf import settings
+
+from .models import Package
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+TRANSFER_CHUNK_SIZE = 64 * 1024 * 1024
+PARTIAL_SUFFIX = '.part'
+UNSUPPORTED_COPY_ERRORS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF)
+
+
+def directory_signature(dir_path):
+    """Returns values which change whenever anything in a directory changes.
+
+    Args:
+        dir_path (pathlib.Path): path to a package directory.
+
+    Returns:
+        signature (dict): latest mtime (in nanoseconds) and total size of the
+            directory and everything in it.
+    """
+    stat = dir_path.stat()
+    mtime_ns, size = stat.st_mtime_ns, 0
+    for root, dirs, files in os.walk(dir_path):
+        for name in dirs:
+            mtime_ns = max(mtime_ns, os.stat(os.path.join(root, name)).st_mtime_ns)
+        for name in files:
+            file_stat = os.stat(os.path.join(root, name))
+            mtime_ns = max(mtime_ns, file_stat.st_mtime_ns)
+            size += file_stat.st_size
+    return {'mtime_ns': mtime_ns, 'size': size}
+
+
+def list_files(package_path):
+    """Lists every file in a package.
+
+    Args:
+        package_path (pathlib.Path): root directory of the package.
+
+    Returns:
+        files (list of dicts): path relative to the package root and size in
+            bytes of each file, sorted by path.
+    """
+    files = []
+    for root, _, filenames in os.walk(package_path):
+        for name in filenames:
+            filepath = Path(root, name)
+            files.append({'path': filepath.relative_to(package_path).as_posix(), 'size': filepath.stat().st_size})
+    return sorted(files, key=lambda file: file['path'])
+
+
+def read_manifest(manifest_path):
+    """Parses a BagIt manifest.
+
+    Args:
+        manifest_path (pathlib.Path): path to a manifest-<algorithm>.txt file.
+
+    Returns:
+        checksums (dict): checksums keyed by file path relative to the bag root.
+    """
+    checksums = {}
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                checksum, filepath = line.rstrip('\r\n').split(maxsplit=1)
+                checksums[filepath.strip()] = checksum.lower()
+    return checksums
+
+
+def get_unready_reason(package_path, signature, quiescence_seconds):
+    """Checks whether a package has finished being delivered.
+
+    Only cheap filesystem checks are performed: the package must have been
+    unchanged for a quiescence window, contain a sentinel file if one is
+    configured, and, if it is a BagIt bag, contain every file listed in its
+    manifests with the total size recorded in its Payload-Oxum.
+
+    Args:
+        package_path (pathlib.Path): root directory of the package.
+        signature (dict): result of directory_signature for the package.
+        quiescence_seconds (float): seconds the package must have been unchanged.
+
+    Returns:
+        reason (str): why the package is not ready, or None if it is ready.
+    """
+    age = (time.time_ns() - signature['mtime_ns']) / 1e9
+    if age < quiescence_seconds:
+        return f'modified {age:.0f} seconds ago'
+    if settings.DISCOVERY_SENTINEL_FILENAME and not (package_path / settings.DISCOVERY_SENTINEL_FILENAME).exists():
+        return f'{settings.DISCOVERY_SENTINEL_FILENAME} not present'
+    if (package_path / 'bagit.txt').exists():
+        manifests = list(package_path.glob('manifest-*.txt'))
+        if not manifests:
+            return 'bag has no payload manifest'
+        for manifest in manifests:
+            missing = [filepath for filepath in read_manifest(manifest) if not (package_path / filepath).is_file()]
+            if missing:
+                return f'{len(missing)} files listed in {manifest.name} not present'
+        oxum = _get_payload_oxum(package_path)
+        if oxum:
+            payload = [fp for fp in (package_path / 'data').rglob('*') if fp.is_file()]
+            if oxum != (sum(fp.stat().st_size for fp in payload), len(payload)):
+                return 'payload does not match Payload-Oxum'
+    return None
+
+
+def _get_payload_oxum(package_path):
+    """Returns expected payload size and file count from bag-info.txt, if present."""
+    bag_info = package_path / 'bag-info.txt'
+    if not bag_info.exists():
+        return None
+    with open(bag_info, encoding='utf-8') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key.strip().lower() == 'payload-oxum':
+                octets, _, count = value.strip().partition('.')
+                return int(octets), int(count)
+    return None
+
+
+def hash_file_digests(filepath, algorithms):
+    """Hashes a file with several algorithms in a single pass.
+
+    The file is streamed through hashlib in large chunks, so memory use does
+    not depend on file size. hashlib releases the GIL while hashing, so
+    several files can be hashed at once using threads.
+
+    Args:
+        filepath (pathlib.Path): path to a file.
+        algorithms (iterable of str): names of hashlib algorithms.
+
+    Returns:
+        checksums (dict): hex digests keyed by algorithm.
+    """
+    digests = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(filepath, 'rb', buffering=0) as f:
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            for digest in digests.values():
+                digest.update(view[:length])
+    return {algorithm: digest.hexdigest() for algorithm, digest in digests.items()}
+
+
+def hash_file(filepath, algorithm='sha256'):
+    """Hashes a file by streaming it through hashlib in large chunks.
+
+    Args:
+        filepath (pathlib.Path): path to a file.
+        algorithm (str): name of a hashlib algorithm.
+
+    Returns:
+        checksum (str): hex digest of the file.
+    """
+    return hash_file_digests(filepath, [algorithm])[algorithm]
+
+
+def check_fixity(package_path, max_workers=None):
+    """Checksums every file in a package and compares them to its BagIt manifests.
+
+    Args:
+        package_path (pathlib.Path): root directory of the package.
+        max_workers (int): maximum number of files to hash at once.
+
+    Returns:
+        status, checksums, errors (tuple): a Package fixity status, checksums
+            keyed by file path relative to the package and then by
+            algorithm, and a list of problems found.
+    """
+    manifests = {manifest.name[len('manifest-'):-len('.txt')]: read_manifest(manifest)
+                 for manifest in package_path.glob('manifest-*.txt')}
+    algorithms = {'sha256', *manifests}
+    filepaths = sorted(fp for fp in package_path.rglob('*') if fp.is_file())
+    with ThreadPoolExecutor(max_workers=max_workers or settings.FIXITY_WORKERS) as executor:
+        digests = executor.map(lambda fp: hash_file_digests(fp, algorithms), filepaths)
+        checksums = {fp.relative_to(package_path).as_posix(): checksums for fp, checksums in zip(filepaths, digests)}
+    if not manifests:
+        return Package.FIXITY_UNVERIFIED, checksums, []
+    errors = []
+    for algorithm, expected in manifests.items():
+        for filepath, checksum in expected.items():
+            if filepath not in checksums:
+                errors.append(f'{filepath} listed in manifest-{algorithm}.txt is missing')
+            elif checksums[filepath][algorithm] != checksum:
+                errors.append(f'{filepath} does not match {algorithm} checksum in manifest-{algorithm}.txt')
+    for filepath in checksums:
+        if filepath.startswith('data/') and not all(filepath in expected for expected in manifests.values()):
+            errors.append(f'{filepath} is not listed in every manifest')
+    return (Package.FIXITY_INVALID if errors else Package.FIXITY_VALID), checksums, errors
+
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def _read_write(src_fd, dst_fd, offset, count):
+    return os.write(dst_fd, os.pread(src_fd, count, offset))
+
+
+def _copy_data(src_fd, dst_fd, offset, size):
+    """Copies bytes from offset onwards to the current position of dst_fd.
+
+    Uses in-kernel copies where the platform and filesystems support them,
+    falling back to sendfile and then to ordinary reads and writes.
+    """
+    methods = [method for method in (
+        _copy_file_range if hasattr(os, 'copy_file_range') else None,
+        _sendfile if hasattr(os, 'sendfile') else None,
+        _read_write) if method]
+    while offset < size:
+        count = min(TRANSFER_CHUNK_SIZE, size - offset)
+        try:
+            copied = methods[0](src_fd, dst_fd, offset, count)
+        except OSError as e:
+            if len(methods) > 1 and e.errno in UNSUPPORTED_COPY_ERRORS:
+                methods.pop(0)
+                continue
+            raise
+        if not copied:
+            raise OSError(errno.EIO, f'Source file ended after {offset} of {size} bytes')
+        offset += copied
+
+
+def transfer_file(source, destination, checksum=None):
+    """Moves a file, copying it if the destination is on another filesystem.
+
+    Copies are written to a `.part` file next to the destination, which is
+    resumed from where it left off if the transfer is interrupted. The copy
+    is checksummed before it is renamed into place and the source is
+    deleted. If the source's checksum is already known only the copy is
+    read back; otherwise the source is hashed as well.
+
+    Args:
+        source (pathlib.Path): file to move.
+        destination (pathlib.Path): new path for the file.
+        checksum (str): expected sha256 hex digest of the file.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.rename(source, destination)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    partial_path = destination.with_name(f'{destination.name}{PARTIAL_SUFFIX}')
+    size = source.stat().st_size
+    src_fd = os.open(source, os.O_RDONLY)
+    try:
+        dst_fd = os.open(partial_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            offset = os.lseek(dst_fd, 0, os.SEEK_END)
+            if offset > size:
+                os.ftruncate(dst_fd, 0)
+                offset = os.lseek(dst_fd, 0, os.SEEK_SET)
+            _copy_data(src_fd, dst_fd, offset, size)
+            os.fsync(dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+    if (checksum or hash_file(source)) != hash_file(partial_path):
+        partial_path.unlink()
+        raise Exception(f'Checksum of copy does not match {source}')
+    copystat(source, partial_path)
+    os.replace(partial_path, destination)
+    source.unlink()
+
+
+def move_package(refid, max_workers=None, checksums=None):
+    """Moves the files in a package to the destination directory.
+
+    Files are transferred concurrently. Files which have already been moved
+    are skipped, so an interrupted move can be safely repeated.
+
+    Args:
+        refid (str): ArchivesSpace ref id, which is also the package directory name.
+        max_workers (int): maximum number of files to transfer at once.
+        checksums (dict): checksums recorded by check_fixity, keyed by file
+            path relative to the package and then by algorithm.
+    """
+    bag_path = Path(settings.BASE_STORAGE_DIR, refid)
+    destination_path = Path(settings.BASE_DESTINATION_DIR, refid)
+    if not bag_path.exists() and destination_path.exists():
+        return
+    filepaths = []
+    for fp in sorted(bag_path.rglob('*')):
+        if fp.is_dir():
+            (destination_path / fp.relative_to(bag_path)).mkdir(parents=True, exist_ok=True)
+        else:
+            filepaths.append(fp)
+    with ThreadPoolExecutor(max_workers=max_workers or settings.TRANSFER_WORKERS) as executor:
+        futures = []
+        for fp in filepaths:
+            relative_path = fp.relative_to(bag_path)
+            checksum = (checksums or {}).get(relative_path.as_posix(), {}).get('sha256')
+            futures.append(executor.submit(transfer_file, fp, destination_path / relative_path, checksum))
+        for future in futures:
+            future.result()
+    rmtree(bag_path)
+
+
+def delete_package(refid):
+    """Removes a package from the storage directory.
+
+    Args:
+        refid (str): ArchivesSpace ref id, which is also the package directory name.
+    """
+    bag_path = Path(settings.BASE_STORAGE_DIR, refid)
+    if bag_path.exists():
+        rmtree(bag_path)
@@ -1,21 +1,49 @@
+import errno
+import fcntl
+import io
 import json
+import os
 import random
 import shutil
+import subprocess
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import ANY, MagicMock, patch
 
 import boto3
+from botocore.exceptions import ClientError
 from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
 from django.shortcuts import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from moto import mock_sns, mock_sqs, mock_ssm, mock_sts
 from moto.core import DEFAULT_ACCOUNT_ID
 
+from . import helpers, storage, watchers
 from .clients import ArchivesSpaceClient, AWSClient
-from .helpers import get_config
+from .helpers import get_archivesspace_client, get_config
 from .management.commands import (check_qc_status, discover_packages,
-                                  fetch_rights_statements)
-from .models import Package, RightsStatement
+                                  dispatch_notifications,
+                                  fetch_rights_statements, process_jobs,
+                                  watch_packages)
+from .media import (ProbeCache, evict_stale_cache_entries, probe_file,
+                    probe_files)
+from .models import (BulkAction, DirectorySnapshot, MediaCache, MediaFile,
+                     OutboxMessage, Package, PackageJob, RightsStatement,
+                     get_av_number_sort)
+from .proxies import evict_proxies, generate_proxy, touch_proxy
+from .qc import (BlackFrameCheck, ClippingCheck, SilenceCheck, run_all_checks,
+                 run_checks)
+from .storage import (check_fixity, directory_signature, get_unready_reason,
+                      hash_file, list_files, move_package, transfer_file)
+from .visuals import compute_waveform
+from .watchers import InotifyWatcher, PollingWatcher
 
 FIXTURE_DIR = "fixtures"
 RIGHTS_DATA = [("1", "foo"), ("2", "bar")]
@@ -55,6 +83,9 @@ def copy_binaries():
 
 class HelpersTests(TestCase):
 
+    def setUp(self):
+        helpers._config_cache.clear()
+
     @mock_ssm
     @patch('package_review.clients.AWSClient.get_client_with_role')
     def test_get_config(self, mock_client):
@@ -72,23 +103,95 @@ class HelpersTests(TestCase):
         self.assertIsInstance(config, dict)
         self.assertEqual(config, {'foo': 'bar', 'baz': 'buzz'})
 
+    @mock_ssm
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_get_config_paginated(self, mock_client):
+        """Asserts configs are fetched from every page of SSM results."""
+        ssm = boto3.client('ssm', region_name='us-east-1')
+        mock_client.return_value = ssm
+        path = "/dev/digitized-av-qc"
+        for i in range(25):
+            ssm.put_parameter(Name=f"{path}/param{i}", Value=str(i), Type="SecureString")
+        config = get_config(path)
+        self.assertEqual(config, {f'param{i}': str(i) for i in range(25)})
 
-class ArchivesSpaceClientTests(TestCase):
+    @patch('package_review.helpers._load_config')
+    def test_get_config_cached(self, mock_load):
+        """Asserts configs are loaded once and refreshed in the background once stale."""
+        mock_load.return_value = {'foo': 'bar'}
+        path = "/dev/digitized-av-qc"
+        self.assertEqual(get_config(path), {'foo': 'bar'})
+        self.assertEqual(get_config(path), {'foo': 'bar'})
+        mock_load.assert_called_once_with(path)
 
-    @patch('asnake.aspace.ASpace.__init__')
-    def setUp(self, mock_init):
+        mock_load.return_value = {'foo': 'buzz'}
+        with override_settings(CONFIG_TTL=0):
+            time.sleep(0.01)
+            self.assertEqual(get_config(path), {'foo': 'bar'})
+            refresh_thread = helpers._config_refreshing.get(path)
+            if refresh_thread:
+                refresh_thread.join()
+        self.assertEqual(get_config(path), {'foo': 'buzz'})
+        self.assertEqual(mock_load.call_count, 2)
+
+    @patch('package_review.clients.ArchivesSpaceClient.__init__')
+    @patch('package_review.helpers.get_config')
+    def test_get_archivesspace_client(self, mock_config, mock_init):
+        """Asserts ArchivesSpace clients are reused for the same configuration."""
+        helpers._archivesspace_clients.clear()
         mock_init.return_value = None
+        mock_config.return_value = {'AS_BASEURL': 'https://archivesspace.org/api', 'AS_USERNAME': 'admin', 'AS_PASSWORD': 'admin', 'AS_REPO': '2'}
+        client = get_archivesspace_client()
+        self.assertIs(get_archivesspace_client(), client)
+        mock_init.assert_called_once_with(baseurl='https://archivesspace.org/api', username='admin', password='admin', repository='2')
+
+        mock_config.return_value = {**mock_config.return_value, 'AS_PASSWORD': 'new-password'}
+        self.assertIsNot(get_archivesspace_client(), client)
+
+
+class ArchivesSpaceClientTests(TestCase):
+
+    @patch('asnake.aspace.ASnakeClient')
+    def setUp(self, mock_client):
+        mock_client.return_value.get.return_value.text = '(v3.3.1)'
+        mock_client.return_value.session.hooks = {'response': []}
         self.as_client = ArchivesSpaceClient(
             username='admin',
             password='admin',
             baseurl='https://archivesspace.org/api',
             repository='2')
+        caches['archivesspace'].clear()
 
     def test_init(self):
         """Asserts repository identifier is correctly set."""
         self.assertEqual(
             self.as_client.repository,
             '2')
+        self.assertEqual(
+            self.as_client.client.session.hooks['response'],
+            [self.as_client.reauthorize_expired_session])
+
+    def test_reauthorize_expired_session(self):
+        """Asserts requests are retried with a new session token when the session has expired."""
+        self.as_client.client.config = {'session_header_name': 'X-ArchivesSpace-Session'}
+        self.as_client.client.session.headers = {'X-ArchivesSpace-Session': 'expired'}
+        self.as_client.client.authorize.reset_mock()
+        self.as_client.client.authorize.side_effect = lambda: self.as_client.client.session.headers.update({'X-ArchivesSpace-Session': 'new'})
+        response = MagicMock(status_code=412, json=lambda: {'code': 'SESSION_GONE'})
+        response.request.headers = {'X-ArchivesSpace-Session': 'expired'}
+        retried_request = response.request.copy.return_value
+        retried_request.headers = {'X-ArchivesSpace-Session': 'expired'}
+
+        output = self.as_client.reauthorize_expired_session(response, timeout=10)
+        self.as_client.client.authorize.assert_called_once_with()
+        self.as_client.client.session.send.assert_called_once_with(retried_request, timeout=10)
+        self.assertEqual(retried_request.headers['X-ArchivesSpace-Session'], 'new')
+        self.assertEqual(output, self.as_client.client.session.send.return_value)
+
+        for status_code, data in [(200, {}), (412, {'code': 'OTHER'})]:
+            response = MagicMock(status_code=status_code, json=lambda: data)
+            self.assertEqual(self.as_client.reauthorize_expired_session(response), response)
+        self.as_client.client.authorize.assert_called_once_with()
 
     def test_get_av_number(self):
         """Asserts AV number is parsed correctly."""
@@ -96,6 +199,53 @@ class ArchivesSpaceClientTests(TestCase):
         av_number = self.as_client.get_av_number(instances)
         self.assertEqual(av_number, "AV 1234")
 
+    def mock_archivesspace_get(self, url, params=None):
+        """Returns archival objects and resources as the ArchivesSpace API would."""
+        if params:
+            data = {'archival_objects': [{
+                'ref': f'/repositories/2/archival_objects/{refid}',
+                '_resolved': {
+                    'ref_id': refid,
+                    'uri': f'/repositories/2/archival_objects/{refid}',
+                    'display_string': f'Object {refid}',
+                    'instances': [],
+                    'dates': [],
+                    'resource': {'ref': f'/repositories/2/resources/{int(refid) % 2}'}}} for refid in params['ref_id[]'] if refid != '3']}
+        else:
+            data = {'uri': url, 'title': f'Resource {url}', 'notes': []}
+        return MagicMock(json=lambda: data)
+
+    def test_get_packages_data(self):
+        """Asserts refids are looked up in chunks and cached."""
+        refids = [str(i) for i in range(5)]
+        self.as_client.client = MagicMock()
+        self.as_client.client.get.side_effect = self.mock_archivesspace_get
+        output = self.as_client.get_packages_data(refids, chunk_size=2)
+        self.assertEqual(self.as_client.client.get.call_count, 5)
+        self.assertEqual(sorted(output), ['0', '1', '2', '4'])
+        self.assertEqual(
+            output['1'],
+            ('Object 1', '', '/repositories/2/archival_objects/1', 'Resource /repositories/2/resources/1', '/repositories/2/resources/1', False))
+
+        self.as_client.client.get.reset_mock()
+        self.assertEqual(self.as_client.get_packages_data(refids, chunk_size=2), output)
+        self.as_client.client.get.assert_called_once()
+
+        with self.assertRaises(Exception):
+            self.as_client.get_package_data('3')
+
+    def test_invalidate_cache(self):
+        """Asserts invalidated objects and their resources are fetched again."""
+        self.as_client.client = MagicMock()
+        self.as_client.client.get.side_effect = self.mock_archivesspace_get
+        self.as_client.get_packages_data(['1', '2'])
+        self.as_client.invalidate_cache(['1'])
+        self.as_client.client.get.reset_mock()
+        self.as_client.get_packages_data(['1', '2'])
+        self.assertEqual(
+            [call.args[0] for call in self.as_client.client.get.call_args_list],
+            ['/repositories/2/find_by_id/archival_objects', '/repositories/2/resources/1'])
+
     def test_has_structured_dates(self):
         """Asserts presence of structured dates are parsed correctly."""
         for dates, expected in [
@@ -122,6 +272,21 @@ class AWSClientTests(TestCase):
 
     def setUp(self):
         create_packages()
+        AWSClient._sessions.clear()
+        AWSClient._clients.clear()
+
+    @mock_sts
+    @patch('package_review.clients.assume_role')
+    def test_get_client_with_role(self, mock_assume_role):
+        """Asserts clients and assumed role sessions are reused."""
+        mock_assume_role.side_effect = lambda session, role_arn: MagicMock(client=MagicMock(side_effect=lambda resource: MagicMock()))
+        sns_client = AWSClient('sns', settings.AWS['role_arn']).client
+        self.assertIs(AWSClient('sns', settings.AWS['role_arn']).client, sns_client)
+        self.assertIsNot(AWSClient('ssm', settings.AWS['role_arn']).client, sns_client)
+        mock_assume_role.assert_called_once()
+
+        AWSClient('sns', 'arn:aws:iam::123456789012:role/other-role')
+        self.assertEqual(mock_assume_role.call_count, 2)
 
     @mock_sns
     @mock_sqs
@@ -157,11 +322,86 @@ class AWSClientTests(TestCase):
         self.assertEqual(message_body['MessageAttributes']['refid']['Value'], package.refid)
         self.assertEqual(message_body['MessageAttributes']['rights_ids']['Value'], "1,2")
 
+    @mock_sns
+    @mock_sqs
+    @mock_sts
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_deliver_messages(self, mock_client):
+        """Asserts messages are delivered in batches of ten."""
+        sns = boto3.client('sns', region_name='us-east-1')
+        mock_client.return_value = sns
+        topic_arn = sns.create_topic(Name='my-topic')['TopicArn']
+        sqs_conn = boto3.resource("sqs", region_name="us-east-1")
+        sqs_conn.create_queue(QueueName="test-queue")
+        sns.subscribe(
+            TopicArn=topic_arn,
+            Protocol="sqs",
+            Endpoint=f"arn:aws:sqs:us-east-1:{DEFAULT_ACCOUNT_ID}:test-queue")
+        package = Package.objects.first()
+        messages = [(package, f"Message {i}", "SUCCESS", "1,2") for i in range(12)]
+
+        client = AWSClient('sns', settings.AWS['role_arn'])
+        with patch.object(sns, 'publish_batch', wraps=sns.publish_batch) as mock_publish:
+            failed = client.deliver_messages(topic_arn, messages)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(mock_publish.call_count, 2)
+        queue = sqs_conn.get_queue_by_name(QueueName="test-queue")
+        received = []
+        while True:
+            batch = queue.receive_messages(MaxNumberOfMessages=10)
+            if not batch:
+                break
+            received.extend(json.loads(m.body) for m in batch)
+        self.assertEqual(sorted(m['Message'] for m in received), sorted(m[1] for m in messages))
+        self.assertEqual(received[0]['MessageAttributes']['refid']['Value'], package.refid)
+
+    @patch('package_review.clients.time.sleep')
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_deliver_messages_retries(self, mock_client, mock_sleep):
+        """Asserts failed entries are retried unless the failure was caused by the message."""
+        package = Package.objects.first()
+        messages = [(package, f"Message {i}", "SUCCESS", None) for i in range(3)]
+        mock_client.return_value.publish_batch.side_effect = [
+            {'Successful': [{'Id': '0'}], 'Failed': [
+                {'Id': '1', 'Code': 'Throttled', 'SenderFault': False},
+                {'Id': '2', 'Code': 'InvalidParameter', 'SenderFault': True}]},
+            {'Successful': [], 'Failed': [{'Id': '1', 'Code': 'Throttled', 'SenderFault': False}]},
+            {'Successful': [{'Id': '1'}], 'Failed': []},
+        ]
 
+        failed = AWSClient('sns', settings.AWS['role_arn']).deliver_messages('topic', messages, backoff=1)
+
+        self.assertEqual(failed, [messages[2]])
+        publish_batch = mock_client.return_value.publish_batch
+        self.assertEqual(publish_batch.call_count, 3)
+        self.assertEqual([e['Id'] for e in publish_batch.call_args[1]['PublishBatchRequestEntries']], ['1'])
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [1, 2])
+
+        mock_client.return_value.publish_batch.side_effect = lambda **kwargs: {
+            'Failed': [{'Id': e['Id'], 'SenderFault': False} for e in kwargs['PublishBatchRequestEntries']]}
+        failed = AWSClient('sns', settings.AWS['role_arn']).deliver_messages('topic', messages, max_attempts=2)
+        self.assertEqual(failed, messages)
+
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_deliver_messages_error(self, mock_client):
+        """Asserts an error publishing one batch only fails the messages in that batch."""
+        package = Package.objects.first()
+        messages = [(package, f"Message {i}", "SUCCESS", None) for i in range(15)]
+        mock_client.return_value.publish_batch.side_effect = [
+            {'Successful': [{'Id': str(i)} for i in range(10)], 'Failed': []},
+            ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'PublishBatch'),
+        ]
+        failed = AWSClient('sns', settings.AWS['role_arn']).deliver_messages('topic', messages, max_attempts=1)
+        self.assertEqual(failed, messages[10:])
+
+
+@override_settings(DISCOVERY_QUIESCENCE_SECONDS=0, VISUALS_ENABLED=False)
 class DiscoverPackagesCommandTests(TestCase):
 
     def setUp(self):
         copy_binaries()
+        helpers._archivesspace_clients.clear()
 
     def test_get_type(self):
         """Asserts correct types are returned."""
@@ -173,45 +413,114 @@ class DiscoverPackagesCommandTests(TestCase):
             discover_packages.Command()._get_type(Path("1234"))
 
     def test_get_duration(self):
-        for (filename, expected) in [("9ba10e5461d401517b0e1a53d514ec87.mp4", 5.759), ("f7d3dd6dc9c4732fa17dbd88fbe652b6.mp3", 27.252)]:
-            output = discover_packages.Command()._get_duration([Path(settings.BASE_STORAGE_DIR, filename.split('.')[0], filename)])
+        output = discover_packages.Command()._get_duration([{'duration': 5.759}, {'duration': 27.252}])
+        self.assertAlmostEqual(output, 33.011)
+
+    def test_has_multiple_masters(self):
+        for (probes, expected) in [([], False), ([{'duration': 1.0}], False), ([{'duration': 1.0}, {'duration': 2.0}], True)]:
+            output = discover_packages.Command()._has_multiple_masters(probes)
             self.assertEqual(output, expected)
 
     @mock_sts
     @patch('package_review.clients.ArchivesSpaceClient.__init__')
-    @patch('package_review.management.commands.discover_packages.Command._get_duration')
-    @patch('package_review.management.commands.discover_packages.Command._has_multiple_masters')
-    @patch('package_review.management.commands.discover_packages.get_config')
-    @patch('package_review.clients.ArchivesSpaceClient.get_package_data')
+    @patch('package_review.management.commands.discover_packages.probe_files')
+    @patch('package_review.helpers.get_config')
+    @patch('package_review.clients.ArchivesSpaceClient.get_packages_data')
     @patch('package_review.clients.AWSClient.deliver_message')
     @patch('package_review.clients.AWSClient.get_client_with_role')
-    def test_handle(self, mock_client, mock_message, mock_package_data, mock_config, mock_masters, mock_duration, mock_init):
+    def test_handle(self, mock_client, mock_message, mock_package_data, mock_config, mock_probe, mock_init):
         """Asserts cron produces expected results."""
         expected_len = len(list(Path(settings.BASE_STORAGE_DIR).iterdir()))
         mock_init.return_value = None
-        mock_masters.return_value = False
-        mock_duration.return_value = 123.45
-        mock_package_data.return_value = 'object_title', 'av_number', 'object_uri', 'resource_title', 'resource_uri', False
+        mock_probe.side_effect = lambda filepaths, **kwargs: [{'filename': fp.name, 'duration': 123.45} for fp in filepaths]
+        mock_package_data.side_effect = lambda refids: {refid: ('object_title', 'av_number', 'object_uri', 'resource_title', 'resource_uri', False) for refid in refids}
 
         discover_packages.Command().handle()
         mock_init.assert_called_once()
         mock_client.assert_not_called()
         mock_message.assert_not_called()
         mock_config.assert_called_once()
-        self.assertEqual(mock_package_data.call_count, expected_len)
+        mock_package_data.assert_called_once()
+        self.assertEqual(len(mock_package_data.call_args[0][0]), expected_len)
         self.assertEqual(Package.objects.all().count(), expected_len)
         for package in Package.objects.all():
             self.assertEqual(package.multiple_masters, False)
             self.assertEqual(package.duration_access, 123.45)
-            self.assertEqual(package.duration_master, 123.45)
+            self.assertEqual(package.duration_master, 0)
+            self.assertEqual(package.media_files.filter(role=MediaFile.ACCESS).count(), 1)
+            self.assertEqual(package.fixity_status, Package.FIXITY_UNVERIFIED)
+            self.assertEqual(package.qc_issues, [])
+            self.assertEqual(package.qc_issue_count, 0)
+            self.assertEqual(list(package.checksums), [next(Path(settings.BASE_STORAGE_DIR, package.refid).iterdir()).name])
+            self.assertEqual(package.tree, list_files(Path(settings.BASE_STORAGE_DIR, package.refid)))
 
         discover_packages.Command().handle()
         mock_message.assert_not_called()
 
+    @override_settings(VISUALS_ENABLED=True)
+    @patch('package_review.clients.ArchivesSpaceClient.__init__')
+    @patch('package_review.management.commands.discover_packages.ProcessPoolExecutor')
+    @patch('package_review.management.commands.discover_packages.compute_visuals')
+    @patch('package_review.media.probe_file')
+    @patch('package_review.helpers.get_config')
+    @patch('package_review.clients.ArchivesSpaceClient.get_packages_data')
+    def test_handle_visuals(self, mock_package_data, mock_config, mock_probe, mock_visuals, mock_pool, mock_init):
+        """Asserts waveforms and sprites are computed once per file and shown on the detail page."""
+        mock_init.return_value = None
+        mock_pool.side_effect = lambda max_workers, mp_context: ThreadPoolExecutor(max_workers=max_workers)
+        mock_probe.side_effect = lambda fp: {'filename': fp.name, 'duration': 10.0}
+        mock_package_data.side_effect = lambda refids: {refid: ('object_title', 'av_number', 'object_uri', 'resource_title', 'resource_uri', False) for refid in refids}
+        mock_visuals.side_effect = lambda filepath, duration, is_video, *args: (array('h', [0, 16384, 32767]).tobytes(), b'jpeg' if is_video else None)
+
+        discover_packages.Command().handle()
+        self.assertEqual(mock_visuals.call_count, 2)
+        self.assertEqual(MediaCache.objects.filter(waveform__isnull=False).count(), 2)
+        self.assertEqual(MediaCache.objects.filter(sprite__isnull=False).count(), 1)
+
+        command = discover_packages.Command()
+        filepath = next(Path(settings.BASE_STORAGE_DIR).glob('*/*.mp4'))
+        command._compute_visuals(filepath, {'duration': 10.0}, Package.VIDEO, ProbeCache(settings.BASE_STORAGE_DIR), MagicMock())
+        self.assertEqual(mock_visuals.call_count, 2)
+
+        video = Package.objects.get(type=Package.VIDEO)
+        response = self.client.get(reverse('package-detail', args=[video.pk]))
+        self.assertEqual(len(response.context['visuals']), 1)
+        self.assertEqual(response.context['visuals'][0]['waveform_path'], 'M0 50.0V50.0M1 25.0V75.0M2 0.0V100.0')
+        self.assertContains(response, 'viewBox="0 0 3 100"')
+        media_file = video.media_files.get()
+        response = self.client.get(reverse('media-file-sprite', args=[media_file.pk]))
+        self.assertEqual(response.content, b'jpeg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        audio = Package.objects.get(type=Package.AUDIO)
+        response = self.client.get(reverse('media-file-sprite', args=[audio.media_files.get().pk]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PROXY_ENABLED=True, PROXY_HLS=True)
+    @patch('package_review.clients.ArchivesSpaceClient.__init__')
+    @patch('package_review.management.commands.discover_packages.evict_proxies')
+    @patch('package_review.management.commands.discover_packages.generate_proxy')
+    @patch('package_review.management.commands.discover_packages.probe_files')
+    @patch('package_review.helpers.get_config')
+    @patch('package_review.clients.ArchivesSpaceClient.get_packages_data')
+    def test_handle_proxies(self, mock_package_data, mock_config, mock_probe, mock_proxy, mock_evict, mock_init):
+        """Asserts proxies are generated for new packages and failures do not affect discovery."""
+        mock_init.return_value = None
+        mock_probe.side_effect = lambda filepaths, **kwargs: [{'filename': fp.name, 'duration': 123.45} for fp in filepaths]
+        mock_package_data.side_effect = lambda refids: {refid: ('object_title', 'av_number', 'object_uri', 'resource_title', 'resource_uri', False) for refid in refids}
+        mock_proxy.side_effect = [None, Exception('ffmpeg failed')]
+
+        discover_packages.Command().handle()
+        self.assertEqual(Package.objects.count(), 2)
+        self.assertEqual(mock_proxy.call_count, 2)
+        for package in Package.objects.all():
+            extension = 'mp3' if package.type == Package.AUDIO else 'mp4'
+            mock_proxy.assert_any_call(Path(settings.BASE_STORAGE_DIR, package.refid, f'{package.refid}.{extension}'), package.refid, package.type, hls=True)
+        mock_evict.assert_called_once_with({package.refid for package in Package.objects.all()})
+
     @mock_sns
     @mock_sts
     @patch('package_review.clients.ArchivesSpaceClient.__init__')
-    @patch('package_review.clients.ArchivesSpaceClient.get_package_data')
+    @patch('package_review.clients.ArchivesSpaceClient.get_packages_data')
     @patch('package_review.clients.AWSClient.deliver_message')
     @patch('package_review.clients.AWSClient.get_client_with_role')
     @patch('package_review.helpers.get_config')
@@ -223,6 +532,454 @@ class DiscoverPackagesCommandTests(TestCase):
         discover_packages.Command().handle()
         self.assertEqual(mock_message.call_count, expected_len)
 
+        discover_packages.Command().handle()
+        self.assertEqual(mock_message.call_count, expected_len * 2)
+
+    def test_unique_pending_refid(self):
+        """Asserts a refid can only be waiting for review once, but can be reviewed again later."""
+        create_packages()
+        package = Package.objects.first()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Package.objects.create(
+                title=package.title, av_number=package.av_number, duration_access=0, duration_master=0,
+                multiple_masters=False, refid=package.refid, type=package.type, process_status=Package.PENDING)
+        Package.objects.filter(pk=package.pk).update(process_status=Package.APPROVED)
+        Package.objects.create(
+            title=package.title, av_number=package.av_number, duration_access=0, duration_master=0,
+            multiple_masters=False, refid=package.refid, type=package.type, process_status=Package.PENDING)
+        self.assertEqual(Package.objects.filter(refid=package.refid).count(), 2)
+
+        output = io.StringIO()
+        call_command('explain_queries', stdout=output)
+        self.assertIn('Pending package', output.getvalue())
+        self.assertIn('Package list by QC issues', output.getvalue())
+
+    @patch('package_review.management.commands.discover_packages.Command._get_package_paths')
+    def test_handle_locked(self, mock_paths):
+        """Asserts discovery does not start while another run holds the lock."""
+        mock_paths.return_value = {}
+        with open(settings.DISCOVERY_LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            output = io.StringIO()
+            discover_packages.Command(stdout=output).handle()
+            mock_paths.assert_not_called()
+            self.assertIn('already running', output.getvalue())
+        discover_packages.Command(stdout=io.StringIO()).handle()
+        mock_paths.assert_called_once()
+
+    def test_get_package_paths(self):
+        """Asserts only new or changed package directories are returned."""
+        command = discover_packages.Command()
+        package_paths = command._get_package_paths()
+        self.assertEqual(len(package_paths), len(list(Path(settings.BASE_STORAGE_DIR).iterdir())))
+        for package_path, signature in package_paths.items():
+            command._save_snapshot(package_path, signature)
+        self.assertEqual(command._get_package_paths(), {})
+        self.assertEqual(len(command._get_package_paths(full=True)), len(package_paths))
+
+        changed_path = sorted(package_paths)[0]
+        with open(changed_path / 'new_file.txt', 'w') as f:
+            f.write('foo')
+        self.assertEqual(list(command._get_package_paths()), [changed_path])
+
+        DirectorySnapshot.objects.update(last_scanned=timezone.now() - timedelta(minutes=settings.DISCOVERY_RESCAN_MINUTES + 1))
+        self.assertEqual(len(command._get_package_paths()), len(package_paths))
+
+        shutil.rmtree(changed_path)
+        command._get_package_paths()
+        self.assertFalse(DirectorySnapshot.objects.filter(name=changed_path.name).exists())
+
+    @override_settings(DISCOVERY_SENTINEL_FILENAME='ready.txt', DISCOVERY_UNREADY_ALERT_HOURS=24)
+    @patch('package_review.management.commands.discover_packages.Command._report_failure')
+    def test_unready_alert(self, mock_report):
+        """Asserts a failure is reported once for a package which stays not ready."""
+        command = discover_packages.Command()
+        package_path = Path(settings.BASE_STORAGE_DIR, "9ba10e5461d401517b0e1a53d514ec87")
+        self.assertNotIn(package_path, command._get_package_paths(quiescence=0))
+        snapshot = DirectorySnapshot.objects.get(name=package_path.name)
+        self.assertIsNotNone(snapshot.unready_since)
+        command._get_package_paths(quiescence=0)
+        mock_report.assert_not_called()
+
+        DirectorySnapshot.objects.update(unready_since=timezone.now() - timedelta(hours=25))
+        command._get_package_paths(quiescence=0)
+        command._get_package_paths(quiescence=0)
+        self.assertEqual(sorted(call[0][0] for call in mock_report.call_args_list), sorted(fp.name for fp in Path(settings.BASE_STORAGE_DIR).iterdir()))
+
+        (package_path / 'ready.txt').write_text('')
+        package_paths = command._get_package_paths(quiescence=0)
+        self.assertIn(package_path, package_paths)
+        command._save_snapshot(package_path, package_paths[package_path])
+        self.assertIsNone(DirectorySnapshot.objects.get(name=package_path.name).unready_since)
+
+    @mock_sts
+    @patch('package_review.clients.ArchivesSpaceClient.__init__')
+    @patch('package_review.management.commands.discover_packages.probe_files')
+    @patch('package_review.helpers.get_config')
+    @patch('package_review.clients.ArchivesSpaceClient.get_packages_data')
+    @patch('package_review.clients.AWSClient.deliver_message')
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_handle_partial_failure(self, mock_client, mock_message, mock_package_data, mock_config, mock_probe, mock_init):
+        """Asserts a failing package does not prevent others from being created."""
+        failing_refid = "9ba10e5461d401517b0e1a53d514ec87"
+        mock_init.return_value = None
+        mock_package_data.side_effect = lambda refids: {refid: ('object_title', 'av_number', 'object_uri', 'resource_title', 'resource_uri', False) for refid in refids}
+
+        def probe(filepaths, **kwargs):
+            if any(failing_refid in str(fp) for fp in filepaths):
+                raise Exception("foo")
+            return []
+        mock_probe.side_effect = probe
+
+        discover_packages.Command().handle(workers=2)
+        mock_message.assert_called_once()
+        self.assertIn(failing_refid, mock_message.call_args[0][2])
+        self.assertFalse(Package.objects.filter(refid=failing_refid).exists())
+        self.assertEqual(Package.objects.all().count(), len(list(Path(settings.BASE_STORAGE_DIR).iterdir())) - 1)
+
+        discover_packages.Command().handle()
+        mock_message.assert_called_once()
+
+        Package.objects.all().delete()
+        mock_message.reset_mock()
+        mock_probe.reset_mock()
+        mock_package_data.side_effect = lambda refids: {refid: ('object_title', 'av_number', 'object_uri', 'resource_title', 'resource_uri', False) for refid in refids if refid != failing_refid}
+        discover_packages.Command().handle(full=True)
+        mock_message.assert_called_once()
+        self.assertIn(failing_refid, mock_message.call_args[0][2])
+        self.assertEqual(mock_probe.call_count, len(list(Path(settings.BASE_STORAGE_DIR).iterdir())) - 1)
+
+    def tearDown(self):
+        for dir in Path(settings.BASE_STORAGE_DIR).iterdir():
+            shutil.rmtree(dir)
+
+
+class MediaTests(TestCase):
+
+    def setUp(self):
+        copy_binaries()
+
+    def test_probe_file(self):
+        """Asserts technical metadata is parsed from ffprobe output."""
+        for (filename, expected_duration, expected_format) in [("9ba10e5461d401517b0e1a53d514ec87.mp4", 5.759, "mp4"), ("f7d3dd6dc9c4732fa17dbd88fbe652b6.mp3", 27.252, "mp3")]:
+            output = probe_file(Path(settings.BASE_STORAGE_DIR, filename.split('.')[0], filename))
+            self.assertEqual(output['filename'], filename)
+            self.assertEqual(output['duration'], expected_duration)
+            self.assertIn(expected_format, output['format_name'])
+            self.assertIsNotNone(output['audio_codec'])
+
+    @patch('package_review.media.probe_file')
+    def test_probe_files(self, mock_probe):
+        """Asserts results are returned in the order files were passed."""
+        mock_probe.side_effect = lambda fp: {'filename': fp.name}
+        filepaths = [Path(f'{i}.mp4') for i in range(10)]
+        output = probe_files(filepaths, max_workers=4)
+        self.assertEqual([probe['filename'] for probe in output], [fp.name for fp in filepaths])
+        self.assertEqual(probe_files([]), [])
+
+    @patch('package_review.media.probe_file')
+    def test_probe_cache(self, mock_probe):
+        """Asserts unchanged files are only probed once across runs."""
+        mock_probe.side_effect = lambda fp: {'filename': fp.name, 'duration': 1.0}
+        filepaths = sorted(Path(settings.BASE_STORAGE_DIR).glob('*/*.mp*'))
+        for expected_calls in [len(filepaths), len(filepaths)]:
+            cache = ProbeCache(settings.BASE_STORAGE_DIR)
+            output = probe_files(filepaths, cache=cache)
+            cache.save()
+            self.assertEqual(len(output), len(filepaths))
+            self.assertEqual(mock_probe.call_count, expected_calls)
+        self.assertEqual(MediaCache.objects.count(), len(filepaths))
+
+        with open(filepaths[0], 'ab') as f:
+            f.write(b'0')
+        cache = ProbeCache(settings.BASE_STORAGE_DIR)
+        probe_files(filepaths, cache=cache)
+        cache.save()
+        self.assertEqual(mock_probe.call_count, len(filepaths) + 1)
+        self.assertEqual(MediaCache.objects.count(), len(filepaths))
+
+    @patch('package_review.visuals.subprocess.Popen')
+    def test_compute_waveform(self, mock_popen):
+        """Asserts peaks are taken from each bucket of decoded samples."""
+        process = mock_popen.return_value
+        process.__enter__.return_value = process
+        process.stdout = io.BytesIO(array('h', [1, -5, 3, 2, -32768, 0, 7]).tobytes())
+        process.returncode = 0
+        waveform = compute_waveform(Path('foo.mp3'), 7, peaks=3, sample_rate=1)
+        self.assertEqual(list(array('h', waveform)), [5, 32767, 7])
+
+        process.stdout = io.BytesIO(b'')
+        process.returncode = 1
+        with self.assertRaises(subprocess.CalledProcessError):
+            compute_waveform(Path('foo.mp3'), 7, peaks=3, sample_rate=1)
+
+    def test_evict_stale_cache_entries(self):
+        """Asserts only cache entries which have not been used recently are evicted."""
+        for path, last_used in [('/foo.mp4', timezone.now()), ('/bar.mp4', timezone.now() - timedelta(days=60))]:
+            MediaCache.objects.create(path=path, size=1, mtime_ns=1, inode=1, probe={}, last_used=last_used)
+        self.assertEqual(evict_stale_cache_entries(30), 1)
+        self.assertEqual(list(MediaCache.objects.values_list('path', flat=True)), ['/foo.mp4'])
+
+    def test_evict_stale_cache_entries_pending(self):
+        """Asserts entries for files of packages waiting to be reviewed are never evicted."""
+        create_packages()
+        pending, reviewed = Package.objects.all()[:2]
+        Package.objects.filter(pk=reviewed.pk).update(process_status=Package.APPROVED)
+        for package in [pending, reviewed]:
+            media_file = MediaFile.objects.create(package=package, filename=f'{package.refid}.mp4', role=MediaFile.ACCESS, duration=1)
+            MediaCache.objects.create(
+                path=media_file.path, size=1, mtime_ns=1, inode=1, probe={}, waveform=b'\x00\x00',
+                last_used=timezone.now() - timedelta(days=60))
+        self.assertEqual(evict_stale_cache_entries(30), 1)
+        self.assertEqual(list(MediaCache.objects.values_list('path', flat=True)), [str(settings.BASE_STORAGE_DIR / pending.refid / f'{pending.refid}.mp4')])
+
+    def tearDown(self):
+        for dir in Path(settings.BASE_STORAGE_DIR).iterdir():
+            shutil.rmtree(dir)
+
+
+class StorageTests(TestCase):
+
+    def setUp(self):
+        copy_binaries()
+        self.package_path = Path(settings.BASE_STORAGE_DIR, "9ba10e5461d401517b0e1a53d514ec87")
+
+    def test_get_unready_reason(self):
+        """Asserts packages which are still being delivered are not ready."""
+        (self.package_path / 'partial.mkv').touch()
+        signature = directory_signature(self.package_path)
+        self.assertIsNone(get_unready_reason(self.package_path, signature, 0))
+        self.assertIn('modified', get_unready_reason(self.package_path, signature, 60))
+
+        with override_settings(DISCOVERY_SENTINEL_FILENAME='transfer.complete'):
+            self.assertIn('not present', get_unready_reason(self.package_path, signature, 0))
+            (self.package_path / 'transfer.complete').touch()
+            self.assertIsNone(get_unready_reason(self.package_path, signature, 0))
+
+    def test_get_unready_reason_bag(self):
+        """Asserts bags are only ready once their payload is complete."""
+        (self.package_path / 'data').mkdir()
+        (self.package_path / 'bagit.txt').write_text('BagIt-Version: 0.97\n')
+        signature = directory_signature(self.package_path)
+        self.assertEqual(get_unready_reason(self.package_path, signature, 0), 'bag has no payload manifest')
+
+        (self.package_path / 'manifest-md5.txt').write_text('acbd18db4cc2f85cedef654fccc4a4d8  data/foo.txt\n')
+        self.assertIn('not present', get_unready_reason(self.package_path, signature, 0))
+
+        (self.package_path / 'data' / 'foo.txt').write_text('fo')
+        (self.package_path / 'bag-info.txt').write_text('Payload-Oxum: 3.1\n')
+        self.assertEqual(get_unready_reason(self.package_path, signature, 0), 'payload does not match Payload-Oxum')
+
+        (self.package_path / 'data' / 'foo.txt').write_text('foo')
+        self.assertIsNone(get_unready_reason(self.package_path, signature, 0))
+
+    def test_hash_file(self):
+        filepath = self.package_path / 'data.txt'
+        filepath.write_bytes(b'foo')
+        self.assertEqual(hash_file(filepath), '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae')
+        self.assertEqual(hash_file(filepath, 'md5'), 'acbd18db4cc2f85cedef654fccc4a4d8')
+
+    def test_check_fixity(self):
+        """Asserts files are checksummed and compared against bag manifests."""
+        status, checksums, errors = check_fixity(self.package_path)
+        self.assertEqual(status, Package.FIXITY_UNVERIFIED)
+        self.assertEqual(list(checksums), ['9ba10e5461d401517b0e1a53d514ec87.mp4'])
+        self.assertEqual(errors, [])
+
+        (self.package_path / 'data').mkdir()
+        (self.package_path / 'data' / 'foo.txt').write_text('foo')
+        (self.package_path / 'data' / 'bar.txt').write_text('bar')
+        (self.package_path / 'manifest-md5.txt').write_text(
+            'acbd18db4cc2f85cedef654fccc4a4d8  data/foo.txt\n37b51d194a7513e45b56f6524f2d51f2  data/bar.txt\n')
+        status, checksums, errors = check_fixity(self.package_path, max_workers=2)
+        self.assertEqual(status, Package.FIXITY_VALID)
+        self.assertEqual(checksums['data/foo.txt'], {
+            'md5': 'acbd18db4cc2f85cedef654fccc4a4d8',
+            'sha256': '2c26b46b68ffc68ff99b453c1d30413413422d706483bfa0f98a5e886266e7ae'})
+
+        (self.package_path / 'data' / 'bar.txt').write_text('baz')
+        (self.package_path / 'data' / 'extra.txt').write_text('extra')
+        status, _, errors = check_fixity(self.package_path)
+        self.assertEqual(status, Package.FIXITY_INVALID)
+        self.assertEqual(errors, [
+            'data/bar.txt does not match md5 checksum in manifest-md5.txt',
+            'data/extra.txt is not listed in every manifest'])
+
+    @patch('package_review.storage.os.rename')
+    def test_transfer_file_across_filesystems(self, mock_rename):
+        """Asserts files are copied, verified and deleted when they cannot be renamed."""
+        mock_rename.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        source = next(self.package_path.glob('*.mp4'))
+        content = source.read_bytes()
+        destination = Path(settings.BASE_DESTINATION_DIR, 'copy', source.name)
+
+        transfer_file(source, destination)
+        self.assertEqual(destination.read_bytes(), content)
+        self.assertFalse(source.exists())
+        self.assertFalse(destination.with_name(f'{destination.name}.part').exists())
+
+        with patch('package_review.storage.os.copy_file_range', side_effect=OSError(errno.EXDEV, 'Invalid cross-device link')):
+            transfer_file(destination, source)
+        self.assertEqual(source.read_bytes(), content)
+
+    @patch('package_review.storage.os.rename')
+    def test_transfer_file_resume(self, mock_rename):
+        """Asserts interrupted copies are resumed, and discarded if they do not match the source."""
+        mock_rename.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        source = next(self.package_path.glob('*.mp4'))
+        content = source.read_bytes()
+        destination = Path(settings.BASE_DESTINATION_DIR, source.name)
+        partial_path = destination.with_name(f'{destination.name}.part')
+        destination.parent.mkdir(parents=True, exist_ok=True)
+
+        partial_path.write_bytes(content[:100])
+        with patch('package_review.storage._copy_data', wraps=storage._copy_data) as mock_copy:
+            transfer_file(source, destination)
+        self.assertEqual(mock_copy.call_args[0][2], 100)
+        self.assertEqual(destination.read_bytes(), content)
+
+        partial_path = source.with_name(f'{source.name}.part')
+        partial_path.write_bytes(b'x' * 100)
+        with self.assertRaises(Exception):
+            transfer_file(destination, source)
+        self.assertFalse(partial_path.exists())
+        self.assertFalse(source.exists())
+        self.assertEqual(destination.read_bytes(), content)
+
+    @patch('package_review.storage.os.rename')
+    def test_transfer_file_checksum(self, mock_rename):
+        """Asserts only the copy is hashed when the source checksum is known."""
+        mock_rename.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        source = next(self.package_path.glob('*.mp4'))
+        content = source.read_bytes()
+        checksum = hash_file(source)
+        destination = Path(settings.BASE_DESTINATION_DIR, source.name)
+
+        with patch('package_review.storage.hash_file', wraps=storage.hash_file) as mock_hash:
+            transfer_file(source, destination, checksum)
+        mock_hash.assert_called_once_with(destination.with_name(f'{destination.name}.part'))
+        self.assertEqual(destination.read_bytes(), content)
+
+        with self.assertRaises(Exception):
+            transfer_file(destination, source, '0' * 64)
+        self.assertTrue(destination.exists())
+        self.assertFalse(source.exists())
+
+    @patch('package_review.storage.os.rename')
+    def test_move_package_across_filesystems(self, mock_rename):
+        mock_rename.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        (self.package_path / 'data').mkdir()
+        (self.package_path / 'data' / 'foo.txt').write_text('foo')
+        expected = sorted(str(fp.relative_to(self.package_path)) for fp in self.package_path.rglob('*'))
+        move_package(self.package_path.name)
+        destination_path = Path(settings.BASE_DESTINATION_DIR, self.package_path.name)
+        self.assertEqual(sorted(str(fp.relative_to(destination_path)) for fp in destination_path.rglob('*')), expected)
+        self.assertFalse(self.package_path.exists())
+
+    def tearDown(self):
+        for path in [settings.BASE_STORAGE_DIR, settings.BASE_DESTINATION_DIR]:
+            if Path(path).exists():
+                shutil.rmtree(path)
+
+
+class WatcherTests(TestCase):
+
+    def setUp(self):
+        Path(settings.BASE_STORAGE_DIR).mkdir(parents=True, exist_ok=True)
+
+    def wait_until_quiet(self, watcher, timeout):
+        """Collects changes until the watcher reports none."""
+        changed_paths = set()
+        while (changes := watcher.wait(timeout)):
+            changed_paths |= changes
+        return changed_paths
+
+    def assert_detects_changes(self, watcher, timeout):
+        package_path = Path(settings.BASE_STORAGE_DIR, "9ba10e5461d401517b0e1a53d514ec87")
+        package_path.mkdir()
+        self.assertEqual(self.wait_until_quiet(watcher, timeout), {package_path})
+        with open(package_path / "file.mp4", "wb") as f:
+            f.write(b"0")
+        self.assertEqual(self.wait_until_quiet(watcher, timeout), {package_path})
+        shutil.rmtree(package_path)
+        self.assertEqual(self.wait_until_quiet(watcher, timeout), {package_path})
+        self.assertEqual(watcher.wait(timeout), set())
+        watcher.close()
+
+    def test_inotify_watcher(self):
+        """Asserts the inotify watcher reports changed package directories."""
+        self.assert_detects_changes(InotifyWatcher(Path(settings.BASE_STORAGE_DIR)), 0.2)
+
+    def test_polling_watcher(self):
+        """Asserts the polling watcher reports changed package directories."""
+        self.assert_detects_changes(PollingWatcher(Path(settings.BASE_STORAGE_DIR), 0), 0)
+
+    def test_inotify_watcher_overflow(self):
+        """Asserts every package is reported as changed, and new directories are watched, when events are dropped."""
+        root_path = Path(settings.BASE_STORAGE_DIR)
+        watcher = InotifyWatcher(root_path)
+        package_paths = {root_path / 'first', root_path / 'second'}
+        for package_path in package_paths:
+            (package_path / 'data').mkdir(parents=True)
+        with patch('package_review.watchers.os.read', return_value=watchers.EVENT_HEADER.pack(-1, watchers.IN_Q_OVERFLOW, 0, 0)):
+            self.assertEqual(watcher.wait(0.2), package_paths)
+        self.assertIn(root_path / 'first' / 'data', watcher.watches.values())
+        watcher.close()
+
+    def tearDown(self):
+        for dir in Path(settings.BASE_STORAGE_DIR).iterdir():
+            shutil.rmtree(dir)
+
+
+class WatchPackagesCommandTests(TestCase):
+
+    def setUp(self):
+        copy_binaries()
+        self.command = watch_packages.Command()
+        self.command.debounce = 30
+        self.command.workers = 1
+        self.command.last_changes = {}
+        self.command.is_empty = False
+
+    @patch('package_review.management.commands.watch_packages.call_command')
+    def test_tick(self, mock_command):
+        """Asserts packages are only discovered once they stop changing."""
+        mock_command.side_effect = lambda command, **options: setattr(command, 'ran', True)
+        package_path = Path(settings.BASE_STORAGE_DIR, "9ba10e5461d401517b0e1a53d514ec87")
+        self.command.tick({package_path}, now=0)
+        self.command.tick({package_path}, now=20)
+        self.command.tick(set(), now=40)
+        mock_command.assert_not_called()
+        self.command.tick(set(), now=50)
+        mock_command.assert_called_once_with(ANY, workers=1, quiescence=30, stdout=self.command.stdout, stderr=self.command.stderr)
+        self.assertIsInstance(mock_command.call_args[0][0], discover_packages.Command)
+        self.assertEqual(self.command.last_changes, {})
+
+    @patch('package_review.management.commands.watch_packages.call_command')
+    def test_tick_locked(self, mock_command):
+        """Asserts settled packages are kept if discovery does not run because another run holds the lock."""
+        package_path = Path(settings.BASE_STORAGE_DIR, "9ba10e5461d401517b0e1a53d514ec87")
+        self.command.tick({package_path}, now=0)
+        self.command.tick(set(), now=30)
+        self.assertEqual(self.command.last_changes, {package_path: 30})
+        mock_command.side_effect = lambda command, **options: setattr(command, 'ran', True)
+        self.command.tick(set(), now=45)
+        self.assertEqual(mock_command.call_count, 1)
+        self.command.tick(set(), now=60)
+        self.assertEqual(mock_command.call_count, 2)
+        self.assertEqual(self.command.last_changes, {})
+
+    @patch('package_review.management.commands.watch_packages.call_command')
+    def test_tick_empty(self, mock_command):
+        """Asserts a completion check runs when the directory becomes empty."""
+        for dir in Path(settings.BASE_STORAGE_DIR).iterdir():
+            shutil.rmtree(dir)
+            self.command.tick({dir}, now=0)
+        self.command.tick(set(), now=30)
+        mock_command.assert_called_once_with('check_qc_status', stdout=self.command.stdout, stderr=self.command.stderr)
+        self.command.tick(set(), now=60)
+        mock_command.assert_called_once()
+
     def tearDown(self):
         for dir in Path(settings.BASE_STORAGE_DIR).iterdir():
             shutil.rmtree(dir)
@@ -260,6 +1017,161 @@ class CheckQCStatusCommandTests(TestCase):
             shutil.rmtree(dir)
 
 
+class DispatchNotificationsCommandTests(TestCase):
+
+    def setUp(self):
+        create_packages()
+        for package in Package.objects.all():
+            OutboxMessage.objects.create(package=package, message='Package reviewed and approved.', outcome='SUCCESS', rights_ids='1,2')
+
+    @patch('package_review.clients.AWSClient.deliver_messages')
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_handle(self, mock_client, mock_deliver):
+        """Asserts queued messages are delivered in batches and marked as sent."""
+        mock_deliver.return_value = []
+        dispatch_notifications.Command().handle(batch_size=1)
+        self.assertEqual(mock_deliver.call_count, Package.objects.count())
+        messages = mock_deliver.call_args_list[0][0][1]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0][1:], ('Package reviewed and approved.', 'SUCCESS', '1,2'))
+        self.assertFalse(OutboxMessage.objects.filter(sent__isnull=True).exists())
+
+        mock_deliver.reset_mock()
+        dispatch_notifications.Command().handle(batch_size=1)
+        mock_deliver.assert_not_called()
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_BACKOFF_SECONDS=0)
+    @patch('package_review.clients.AWSClient.deliver_messages')
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_handle_failure(self, mock_client, mock_deliver):
+        """Asserts undelivered messages are retried until they run out of attempts."""
+        failed_package = Package.objects.first()
+        mock_deliver.side_effect = lambda topic, messages, max_attempts: [m for m in messages if m[0] == failed_package]
+        dispatch_notifications.Command().handle(batch_size=10)
+        self.assertEqual(mock_deliver.call_count, 2)
+        failed = OutboxMessage.objects.get(package=failed_package)
+        self.assertIsNone(failed.sent)
+        self.assertEqual(failed.attempts, 2)
+        self.assertEqual(OutboxMessage.objects.filter(sent__isnull=False).count(), Package.objects.count() - 1)
+
+    @override_settings(OUTBOX_BACKOFF_SECONDS=60)
+    @patch('package_review.clients.AWSClient.deliver_messages')
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_handle_backoff(self, mock_client, mock_deliver):
+        """Asserts failed messages are not retried until their backoff has passed."""
+        mock_deliver.side_effect = lambda topic, messages, max_attempts: messages
+        dispatch_notifications.Command().handle(batch_size=10)
+        self.assertEqual(mock_deliver.call_count, 1)
+        for outbox_message in OutboxMessage.objects.all():
+            self.assertEqual(outbox_message.attempts, 1)
+            self.assertGreater(outbox_message.next_attempt, timezone.now() + timedelta(seconds=50))
+
+    @override_settings(OUTBOX_BACKOFF_SECONDS=60, OUTBOX_MAX_ATTEMPTS=2)
+    @patch('package_review.clients.AWSClient.deliver_messages')
+    @patch('package_review.clients.AWSClient.get_client_with_role')
+    def test_handle_give_up(self, mock_client, mock_deliver):
+        """Asserts messages are reported when they will not be attempted again."""
+        mock_deliver.side_effect = lambda topic, messages, max_attempts: messages
+        with self.assertNoLogs(level='ERROR'):
+            dispatch_notifications.Command().handle(batch_size=10)
+        OutboxMessage.objects.update(next_attempt=timezone.now())
+        with self.assertLogs(level='ERROR') as logs:
+            dispatch_notifications.Command().handle(batch_size=10)
+        self.assertEqual(len(logs.records), OutboxMessage.objects.count())
+        self.assertIn('Giving up', logs.output[0])
+        OutboxMessage.objects.update(next_attempt=timezone.now())
+        dispatch_notifications.Command().handle(batch_size=10)
+        self.assertEqual(mock_deliver.call_count, 2)
+
+
+class ProcessJobsCommandTests(TestCase):
+
+    def setUp(self):
+        create_packages()
+        copy_binaries()
+        if Path(settings.BASE_DESTINATION_DIR).exists():
+            shutil.rmtree(Path(settings.BASE_DESTINATION_DIR))
+
+    def test_approve(self):
+        """Asserts approved packages are moved, updated and queued for notification."""
+        for package in Package.objects.all():
+            PackageJob.objects.create(package=package, action=PackageJob.APPROVE, rights_ids='1,2')
+        process_jobs.Command().handle(workers=2)
+        for package in Package.objects.all():
+            self.assertEqual(package.process_status, Package.APPROVED)
+            self.assertEqual(package.rights_ids, '1,2')
+            self.assertEqual(package.jobs.get().status, PackageJob.COMPLETE)
+            outbox_message = package.outbox_messages.get()
+            self.assertEqual(outbox_message.outcome, 'SUCCESS')
+            self.assertEqual(outbox_message.rights_ids, '1,2')
+        self.assertEqual(len(list(Path(settings.BASE_STORAGE_DIR).iterdir())), 0)
+        self.assertEqual(len(list(Path(settings.BASE_DESTINATION_DIR).iterdir())), Package.objects.all().count())
+
+    def test_reject(self):
+        """Asserts rejected packages are deleted, updated and queued for notification."""
+        for package in Package.objects.all():
+            PackageJob.objects.create(package=package, action=PackageJob.REJECT)
+        process_jobs.Command().handle(workers=1)
+        for package in Package.objects.all():
+            self.assertEqual(package.process_status, Package.REJECTED)
+            self.assertEqual(package.jobs.get().status, PackageJob.COMPLETE)
+            self.assertEqual(package.outbox_messages.get().outcome, 'FAILURE')
+        self.assertEqual(len(list(Path(settings.BASE_STORAGE_DIR).iterdir())), 0)
+
+    def test_failure(self):
+        """Asserts a failed job does not change its package or prevent other jobs from completing."""
+        missing, present = Package.objects.all()[:2]
+        shutil.rmtree(Path(settings.BASE_STORAGE_DIR, missing.refid))
+        for package in [missing, present]:
+            PackageJob.objects.create(package=package, action=PackageJob.APPROVE, rights_ids='1')
+        process_jobs.Command().handle(workers=2)
+        missing_job = missing.jobs.get()
+        self.assertEqual(missing_job.status, PackageJob.FAILED)
+        self.assertTrue(missing_job.error)
+        self.assertEqual(Package.objects.get(pk=missing.pk).process_status, Package.PENDING)
+        self.assertFalse(missing.outbox_messages.exists())
+        self.assertEqual(present.jobs.get().status, PackageJob.COMPLETE)
+
+    def test_complete_job_keeps_other_fields(self):
+        """Asserts completing a job does not overwrite package fields edited while it ran."""
+        package = Package.objects.first()
+        job = PackageJob.objects.create(package=package, action=PackageJob.APPROVE, rights_ids='1')
+        job = PackageJob.objects.select_related('package').get(pk=job.pk)
+        Package.objects.filter(pk=package.pk).update(title='Edited title')
+        process_jobs.Command().complete_job(job)
+        package.refresh_from_db()
+        self.assertEqual(package.title, 'Edited title')
+        self.assertEqual(package.process_status, Package.APPROVED)
+        self.assertEqual(package.rights_ids, '1')
+
+    @override_settings(JOB_STALE_MINUTES=10)
+    def test_claim_stale_jobs(self):
+        """Asserts jobs left running by a stopped worker are claimed again."""
+        first, second = Package.objects.all()[:2]
+        running = PackageJob.objects.create(package=first, action=PackageJob.APPROVE, status=PackageJob.RUNNING, started=timezone.now())
+        stale = PackageJob.objects.create(package=second, action=PackageJob.APPROVE, status=PackageJob.RUNNING, started=timezone.now() - timedelta(minutes=20))
+        self.assertEqual(process_jobs.Command().claim_jobs(10), [stale])
+        self.assertNotIn(running, process_jobs.Command().claim_jobs(10))
+
+    @override_settings(JOB_STALE_MINUTES=0)
+    @patch('package_review.management.commands.process_jobs.Command.run_job')
+    def test_running_jobs_not_claimed_again(self, mock_run_job):
+        """Asserts a long-running job is not claimed again by the process running it."""
+        slow, fast = Package.objects.all()[:2]
+        slow_job = PackageJob.objects.create(package=slow, action=PackageJob.APPROVE, rights_ids='1')
+        PackageJob.objects.create(package=fast, action=PackageJob.APPROVE, rights_ids='1')
+        mock_run_job.side_effect = lambda job: time.sleep(0.5) if job.pk == slow_job.pk else None
+        process_jobs.Command().handle(workers=2)
+        self.assertEqual(mock_run_job.call_count, 2)
+        for package in [slow, fast]:
+            self.assertEqual(package.outbox_messages.count(), 1)
+
+    def tearDown(self):
+        for path in [settings.BASE_STORAGE_DIR, settings.BASE_DESTINATION_DIR]:
+            if Path(path).exists():
+                shutil.rmtree(path)
+
+
 class FetchRightsStatementsCommandTests(TestCase):
 
     @patch('package_review.clients.AquilaClient.available_rights_statements')
@@ -298,48 +1210,193 @@ class ViewMixinTests(TestCase):
             self.assertEqual(Package.objects.all().count(), len(response.context['object_list']))
 
 
+class PackageListViewTests(TestCase):
+
+    def setUp(self):
+        for number in [30, 4, 200, 4, 1000, 15, 7]:
+            Package.objects.create(
+                title=f'Title {number}', av_number=f'AV {number}', duration_access=0, duration_master=0,
+                multiple_masters=number > 100, refid=f'{number:032d}'[:31] + str(Package.objects.count()),
+                type=Package.AUDIO if number % 2 else Package.VIDEO, resource_uri=f'/repositories/2/resources/{number % 3}',
+                qc_issue_count=number % 5, process_status=Package.PENDING)
+        Package.objects.create(
+            title='Approved', av_number='AV 1', duration_access=0, duration_master=0, multiple_masters=False,
+            refid='approved', type=Package.AUDIO, process_status=Package.APPROVED)
+
+    def get_pages(self, url, direction='next_url'):
+        """Follows pagination links, returning AV numbers on each page."""
+        pages = []
+        response = self.client.get(url)
+        while True:
+            pages.append([package.av_number for package in response.context['object_list']])
+            if not response.context[direction]:
+                return pages, response
+            response = self.client.get(response.context[direction])
+
+    def test_get_av_number_sort(self):
+        for av_number, expected in [('AV 1234', 1234), ('AV 12a', 12), ('av12', 12), ('', 0), ('unknown', 0)]:
+            self.assertEqual(get_av_number_sort(av_number), expected)
+        package = Package.objects.get(av_number='AV 1000')
+        package.av_number = 'AV 5'
+        package.save(update_fields=['av_number'])
+        package.refresh_from_db()
+        self.assertEqual(package.av_number_sort, 5)
+
+    @override_settings(PACKAGE_LIST_PAGE_SIZE=3)
+    def test_keyset_pagination(self):
+        """Asserts pages follow on from one another in both directions."""
+        expected = ['AV 4', 'AV 4', 'AV 7', 'AV 15', 'AV 30', 'AV 200', 'AV 1000']
+        pages, response = self.get_pages(reverse('package-list'))
+        self.assertEqual(pages, [expected[:3], expected[3:6], expected[6:]])
+        self.assertIsNone(response.context['next_url'])
+        pages, response = self.get_pages(response.context['previous_url'], 'previous_url')
+        self.assertEqual(pages, [expected[3:6], expected[:3]])
+        self.assertIsNone(response.context['previous_url'])
+
+        pages, _ = self.get_pages(f'{reverse("package-list")}?sort=-title')
+        self.assertEqual([av_number for page in pages for av_number in page], sorted(expected, key=lambda n: f'Title {n[3:]}', reverse=True))
+
+        response = self.client.get(reverse('package-list'), {'after': 'invalid'})
+        self.assertEqual([package.av_number for package in response.context['object_list']], expected[:3])
+
+    def test_filters(self):
+        for params, expected in [
+                ({'type': Package.AUDIO}, ['AV 7', 'AV 15']),
+                ({'multiple_masters': '1'}, ['AV 200', 'AV 1000']),
+                ({'collection': '/repositories/2/resources/1', 'multiple_masters': '0'}, ['AV 4', 'AV 4', 'AV 7']),
+                ({'qc_issues': '0', 'sort': '-av_number'}, ['AV 1000', 'AV 200', 'AV 30', 'AV 15'])]:
+            response = self.client.get(reverse('package-list'), params)
+            self.assertEqual([package.av_number for package in response.context['object_list']], expected)
+
+    def test_tree(self):
+        """Asserts package structure is only loaded when it is requested."""
+        package = Package.objects.get(av_number='AV 30')
+        package.tree = [{'path': 'data/AV30.mp3', 'size': 2048}, {'path': 'bagit.txt', 'size': None}]
+        package.save()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('package-list'))
+        for obj in response.context['object_list']:
+            self.assertTrue({'tree', 'checksums', 'search_vector'} <= obj.get_deferred_fields())
+        form_data = "&".join([f'{str(obj.pk)}=on' for obj in Package.objects.all()])
+        response = self.client.get(f'{reverse("package-bulk-reject")}?{form_data}')
+        self.assertIn('tree', response.context['object_list'][0].get_deferred_fields())
+
+        response = self.client.get(reverse('package-detail', args=[package.pk]))
+        self.assertIn('tree', response.context['object'].get_deferred_fields())
+        self.assertContains(response, reverse('package-tree', args=[package.pk]))
+        response = self.client.get(reverse('package-tree', args=[package.pk]))
+        self.assertContains(response, 'data/AV30.mp3')
+        self.assertContains(response, '2.0\xa0KB')
+
+    def test_search(self):
+        """Asserts packages are found by any searchable field, whatever their status."""
+        Package.objects.filter(av_number='AV 200').update(resource_title='Rockefeller Family Films')
+        for query, expected in [
+                ('title 15', ['AV 15']),
+                ('family films', ['AV 200']),
+                ('av 1', ['AV 1', 'AV 15', 'AV 1000']),
+                ('approved', ['AV 1']),
+                ('', [])]:
+            response = self.client.get(reverse('package-search'), {'q': query})
+            self.assertEqual([package.av_number for package in response.context['object_list']], expected)
+
+        with override_settings(SEARCH_RESULTS_LIMIT=2):
+            response = self.client.get(reverse('package-search'), {'q': 'av'})
+            self.assertEqual(len(response.context['object_list']), 2)
+
+
 class PackageActionViewTests(TestCase):
 
     def setUp(self):
         create_rights_statements()
         create_packages()
         copy_binaries()
+        helpers._archivesspace_clients.clear()
         if Path(settings.BASE_DESTINATION_DIR).exists():
             shutil.rmtree(Path(settings.BASE_DESTINATION_DIR))
 
-    @patch('package_review.clients.AWSClient.__init__')
-    @patch('package_review.clients.AWSClient.deliver_message')
-    def test_approve_view(self, mock_deliver, mock_init):
-        mock_init.return_value = None
+    def test_approve_view(self):
         pkg_list = ",".join([str(obj.id) for obj in Package.objects.all()])
         rights_list = ",".join([str(obj.id) for obj in RightsStatement.objects.all()])
         response = self.client.post(f'{reverse("package-approve")}?object_list={pkg_list}&rights_ids={rights_list}')
-        self.assertEqual(mock_deliver.call_count, Package.objects.all().count())
         for package in Package.objects.all():
-            self.assertEqual(package.process_status, Package.APPROVED)
-            self.assertEqual(package.rights_ids, rights_list)
-        self.assertEqual(len(list(Path(settings.BASE_STORAGE_DIR).iterdir())), 0)
-        self.assertEqual(len(list(Path(settings.BASE_DESTINATION_DIR).iterdir())), Package.objects.all().count())
+            self.assertEqual(package.process_status, Package.PENDING)
+            job = package.jobs.get()
+            self.assertEqual(job.action, PackageJob.APPROVE)
+            self.assertEqual(job.status, PackageJob.QUEUED)
+            self.assertEqual(job.rights_ids, rights_list)
+        self.assertEqual(len(list(Path(settings.BASE_STORAGE_DIR).iterdir())), Package.objects.all().count())
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse('package-list'))
 
-    @patch('package_review.clients.AWSClient.__init__')
-    @patch('package_review.clients.AWSClient.deliver_message')
-    def test_reject_view(self, mock_delete, mock_init):
-        mock_init.return_value = None
+        self.client.post(f'{reverse("package-approve")}?object_list={pkg_list}&rights_ids={rights_list}')
+        self.assertEqual(PackageJob.objects.count(), Package.objects.all().count())
+
+        response = self.client.get(reverse('package-list'))
+        self.assertContains(response, 'Approve: Queued', count=Package.objects.all().count())
+
+    def test_bulk_action_progress(self):
+        """Asserts API clients get the ID of queued jobs and can follow their progress."""
+        packages = list(Package.objects.all())
+        pkg_list = ",".join([str(obj.id) for obj in packages])
+        response = self.client.post(f'{reverse("package-approve")}?object_list={pkg_list}&rights_ids=1', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        bulk_action = BulkAction.objects.get(pk=response.json()['id'])
+        self.assertEqual(response.json()['progress_url'], reverse('bulk-action-progress', args=[bulk_action.pk]))
+        self.assertEqual(bulk_action.jobs.count(), len(packages))
+
+        response = self.client.get(reverse('package-list'))
+        self.assertContains(response, reverse('bulk-action-progress', args=[bulk_action.pk]))
+        progress = self.client.get(reverse('bulk-action-progress', args=[bulk_action.pk])).json()
+        self.assertEqual((progress['action'], progress['total'], progress['queued'], progress['done']), ('Approve', len(packages), len(packages), False))
+
+        shutil.rmtree(Path(settings.BASE_STORAGE_DIR, packages[0].refid))
+        process_jobs.Command().handle(workers=2)
+        progress = self.client.get(reverse('bulk-action-progress', args=[bulk_action.pk])).json()
+        self.assertEqual((progress['complete'], progress['failed'], progress['done']), (len(packages) - 1, 1, True))
+        self.assertEqual(progress['errors'][0]['av_number'], packages[0].av_number)
+        response = self.client.get(reverse('package-list'))
+        self.assertNotContains(response, reverse('bulk-action-progress', args=[bulk_action.pk]))
+        self.assertEqual(self.client.get(reverse('bulk-action-progress', args=[0])).status_code, 404)
+
+    def test_reject_view(self):
         pkg_list = ",".join([str(obj.id) for obj in Package.objects.all()])
         response = self.client.post(f'{reverse("package-reject")}?object_list={pkg_list}')
-        self.assertEqual(mock_delete.call_count, Package.objects.all().count())
         for package in Package.objects.all():
-            self.assertEqual(package.process_status, Package.REJECTED)
-        self.assertTrue(len(list(Path(settings.BASE_STORAGE_DIR).iterdir())) == 0)
+            self.assertEqual(package.process_status, Package.PENDING)
+            self.assertEqual(package.jobs.get().action, PackageJob.REJECT)
+        self.assertEqual(len(list(Path(settings.BASE_STORAGE_DIR).iterdir())), Package.objects.all().count())
         self.assertEqual(response.status_code, 302)
         self.assertEqual(response.url, reverse('package-list'))
 
+    def test_one_active_job(self):
+        """Asserts a package cannot have two jobs in progress, but can be queued again once a job has finished."""
+        package = Package.objects.first()
+        PackageJob.objects.create(package=package, action=PackageJob.APPROVE, status=PackageJob.FAILED)
+        PackageJob.objects.create(package=package, action=PackageJob.APPROVE)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PackageJob.objects.create(package=package, action=PackageJob.REJECT)
+        with patch('package_review.views.PackageActionView._get_queryset', return_value=Package.objects.filter(pk=package.pk)), \
+                patch('django.db.models.QuerySet.exclude', lambda queryset, *args, **kwargs: queryset):
+            response = self.client.post(f'{reverse("package-reject")}?object_list={package.pk}')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(package.jobs.get(status=PackageJob.QUEUED).action, PackageJob.APPROVE)
+
+    def test_reviewed_packages_not_queued(self):
+        """Asserts packages which have already been approved or rejected cannot be queued again."""
+        approved, rejected = Package.objects.all()[:2]
+        Package.objects.filter(pk=approved.pk).update(process_status=Package.APPROVED)
+        Package.objects.filter(pk=rejected.pk).update(process_status=Package.REJECTED)
+        pkg_list = f'{approved.pk},{rejected.pk}'
+        self.client.post(f'{reverse("package-approve")}?object_list={pkg_list}&rights_ids=1')
+        self.client.post(f'{reverse("package-reject")}?object_list={pkg_list}')
+        self.assertFalse(PackageJob.objects.exists())
+
     @patch('package_review.clients.ArchivesSpaceClient.__init__')
-    @patch('package_review.clients.ArchivesSpaceClient.get_package_data')
-    @patch('package_review.views.get_config')
-    def test_refresh_view(self, mock_config, mock_data, mock_init):
+    @patch('package_review.clients.ArchivesSpaceClient.invalidate_cache')
+    @patch('package_review.clients.ArchivesSpaceClient.get_packages_data')
+    @patch('package_review.helpers.get_config')
+    def test_refresh_view(self, mock_config, mock_data, mock_invalidate, mock_init):
         mock_init.return_value = None
         title = "title"
         av_number = "AV 1234"
@@ -347,9 +1404,10 @@ class PackageActionViewTests(TestCase):
         resource_title = "resource title"
         resource_uri = "/repositories/2/resources/1"
         undated_object = True
-        mock_data.return_value = title, av_number, object_uri, resource_title, resource_uri, undated_object
         package = random.choice(Package.objects.all())
+        mock_data.return_value = {package.refid: (title, av_number, object_uri, resource_title, resource_uri, undated_object)}
         response = self.client.get(f'{reverse("refresh-data")}?object_list={package.id}')
+        mock_invalidate.assert_called_once_with([package.refid])
         package.refresh_from_db()
         self.assertEqual(package.title, title)
         self.assertEqual(package.av_number, av_number)
@@ -365,6 +1423,221 @@ class PackageActionViewTests(TestCase):
             shutil.rmtree(Path(settings.BASE_DESTINATION_DIR))
 
 
+class ProxyTests(TestCase):
+
+    def setUp(self):
+        create_packages()
+        self.package = Package.objects.get(type=Package.VIDEO)
+
+    def write_outputs(self, args, **kwargs):
+        Path(args[-1]).write_bytes(b'proxy')
+
+    @patch('package_review.proxies.subprocess.run')
+    def test_generate_proxy(self, mock_run):
+        """Asserts proxies are transcoded into place."""
+        mock_run.side_effect = self.write_outputs
+        source = Path(settings.BASE_STORAGE_DIR, self.package.refid, f'{self.package.refid}.mp4')
+        proxy_dir = generate_proxy(source, self.package.refid, Package.VIDEO, hls=True)
+        self.assertEqual(proxy_dir, Path(settings.PROXY_ROOT, self.package.refid))
+        self.assertEqual(sorted(fp.name for fp in proxy_dir.iterdir()), [f'{self.package.refid}.m3u8', f'{self.package.refid}.mp4'])
+        self.assertEqual(mock_run.call_count, 2)
+        self.assertIn('libx264', mock_run.call_args_list[0][0][0])
+        self.assertIn('hls', mock_run.call_args_list[1][0][0])
+        self.assertEqual([fp.name for fp in proxy_dir.parent.iterdir()], [self.package.refid])
+
+        mock_run.side_effect = subprocess.CalledProcessError(1, 'ffmpeg')
+        with self.assertRaises(subprocess.CalledProcessError):
+            generate_proxy(source, self.package.refid, Package.VIDEO)
+        self.assertEqual([fp.name for fp in proxy_dir.parent.iterdir()], [self.package.refid])
+
+    def test_evict_proxies(self):
+        """Asserts proxies for reviewed packages and least recently used proxies are evicted."""
+        for index, refid in enumerate(['reviewed', 'old', 'new']):
+            proxy_dir = Path(settings.PROXY_ROOT, refid)
+            proxy_dir.mkdir(parents=True)
+            (proxy_dir / f'{refid}.mp4').write_bytes(b'0' * 100)
+            os.utime(proxy_dir, ns=(index * 10 ** 9, index * 10 ** 9))
+        self.assertEqual(evict_proxies({'old', 'new'}, max_bytes=200), 1)
+        touch_proxy('old')
+        self.assertEqual(evict_proxies({'old', 'new'}, max_bytes=150), 1)
+        self.assertEqual([fp.name for fp in Path(settings.PROXY_ROOT).iterdir()], ['old'])
+
+    @override_settings(PROXY_TEMP_MAX_AGE_HOURS=1)
+    def test_evict_proxies_temp_dirs(self):
+        """Asserts temporary directories are only evicted once they have been left unchanged."""
+        stale_dir, active_dir = Path(settings.PROXY_ROOT, '.stale-1'), Path(settings.PROXY_ROOT, '.active-1')
+        for tmp_dir in [stale_dir, active_dir]:
+            tmp_dir.mkdir(parents=True)
+            (tmp_dir / 'proxy.mp4').write_bytes(b'0')
+            os.utime(tmp_dir, (0, 0))
+        os.utime(stale_dir / 'proxy.mp4', (0, 0))
+        self.assertEqual(evict_proxies(set()), 0)
+        self.assertEqual([fp.name for fp in Path(settings.PROXY_ROOT).iterdir()], ['.active-1'])
+
+    def test_detail_view(self):
+        """Asserts the detail page plays the proxy before the original file."""
+        response = self.client.get(reverse('package-detail', args=[self.package.pk]))
+        self.assertNotIn('proxy_url', response.context)
+
+        proxy_dir = Path(settings.PROXY_ROOT, self.package.refid)
+        proxy_dir.mkdir(parents=True)
+        (proxy_dir / f'{self.package.refid}.mp4').write_bytes(b'proxy')
+        response = self.client.get(reverse('package-detail', args=[self.package.pk]))
+        proxy_url = f'/proxies/{self.package.refid}/{self.package.refid}.mp4'
+        self.assertEqual(response.context['proxy_url'], proxy_url)
+        self.assertNotIn('playlist_url', response.context)
+        content = response.content.decode()
+        self.assertLess(content.index(proxy_url), content.index(f'/media/{self.package.refid}/'))
+
+        response = self.client.get(proxy_url, HTTP_RANGE='bytes=0-1')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'pr')
+
+    @patch('package_review.views.touch_proxy')
+    def test_proxy_view_touch(self, mock_touch):
+        """Asserts only proxies inside the proxy root are marked as used."""
+        proxy_dir = Path(settings.PROXY_ROOT, self.package.refid)
+        proxy_dir.mkdir(parents=True)
+        (proxy_dir / f'{self.package.refid}.mp4').write_bytes(b'proxy')
+        for path in ['../proxies/foo.mp4', f'{self.package.refid}/../../{self.package.refid}.mp4', 'missing/missing.mp4']:
+            self.assertEqual(self.client.get(f'/proxies/{path}').status_code, 404)
+        mock_touch.assert_not_called()
+        self.assertEqual(self.client.get(f'/proxies/{self.package.refid}/{self.package.refid}.mp4').status_code, 200)
+        mock_touch.assert_called_once_with(self.package.refid)
+
+    def tearDown(self):
+        if Path(settings.PROXY_ROOT).exists():
+            shutil.rmtree(settings.PROXY_ROOT)
+
+
+class QCTests(TestCase):
+
+    def setUp(self):
+        self.probe = {'duration': 60.0, 'audio_codec': 'aac', 'video_codec': 'h264'}
+
+    def test_parse(self):
+        """Asserts flagged time ranges are parsed from ffmpeg output."""
+        output = "\n".join([
+            "[silencedetect @ 0x1] silence_start: -0.01",
+            "[silencedetect @ 0x1] silence_end: 3.5 | silence_duration: 3.51",
+            "[blackdetect @ 0x2] black_start:10 black_end:12.5 black_duration:2.5",
+            "frame:0    pts:0       pts_time:0",
+            "lavfi.astats.Overall.Peak_level=-0.000000",
+            "frame:1    pts:48000   pts_time:1",
+            "lavfi.astats.Overall.Peak_level=-0.050000",
+            "frame:2    pts:96000   pts_time:2",
+            "lavfi.astats.Overall.Peak_level=-6.000000",
+            "frame:3    pts:144000  pts_time:3",
+            "lavfi.astats.Overall.Peak_level=0.000000",
+            "[silencedetect @ 0x1] silence_start: 55",
+        ])
+        self.assertEqual(SilenceCheck().parse(output, 60.0), [(0, 3.5, 'Silence'), (55.0, 60.0, 'Silence')])
+        self.assertEqual(BlackFrameCheck().parse(output, 60.0), [(10.0, 12.5, 'Black frames')])
+        self.assertEqual(ClippingCheck().parse(output, 60.0), [(0.0, 2.0, 'Clipping'), (3.0, 4.0, 'Clipping')])
+
+    @patch('package_review.qc.subprocess.run')
+    def test_run_checks(self, mock_run):
+        """Asserts all checks run in a single ffmpeg process and only against matching streams."""
+        mock_run.return_value = MagicMock(returncode=0, stdout='', stderr='[blackdetect @ 0x2] black_start:1 black_end:4 black_duration:3')
+        checks = [SilenceCheck(), BlackFrameCheck()]
+        issues = run_checks(Path('foo.mp4'), self.probe, checks)
+        self.assertEqual(issues, [{'check': 'black', 'filename': 'foo.mp4', 'start': 1.0, 'end': 4.0, 'description': 'Black frames'}])
+        args = mock_run.call_args[0][0]
+        self.assertIn('-af', args)
+        self.assertIn('-vf', args)
+
+        run_checks(Path('foo.mp3'), {'duration': 60.0, 'audio_codec': 'mp3'}, checks)
+        self.assertIn('-vn', mock_run.call_args[0][0])
+        self.assertEqual(run_checks(Path('foo.mp3'), {'duration': 60.0, 'audio_codec': 'mp3'}, [BlackFrameCheck()]), [])
+
+        mock_run.return_value = MagicMock(returncode=1, stdout='', stderr='Invalid data found when processing input')
+        self.assertEqual(run_checks(Path('foo.mp4'), self.probe, checks)[0]['check'], 'decode')
+
+    @override_settings(QC_CHECKS=['package_review.qc.BlackFrameCheck'])
+    @patch('package_review.qc.run_checks')
+    def test_run_all_checks(self, mock_run_checks):
+        mock_run_checks.side_effect = lambda filepath, probe, checks: [
+            {'check': checks[0].name, 'filename': filepath.name, 'start': start} for start in [5, 1]]
+        issues = run_all_checks([Path('a.mp4'), Path('b.mkv')], [self.probe, self.probe], max_workers=2)
+        self.assertEqual([(issue['filename'], issue['start']) for issue in issues], [('a.mp4', 1), ('a.mp4', 5), ('b.mkv', 1), ('b.mkv', 5)])
+        self.assertEqual({issue['check'] for issue in issues}, {'black'})
+
+        with override_settings(QC_CHECKS=[]):
+            self.assertEqual(run_all_checks([Path('a.mp4')], [self.probe]), [])
+
+    def test_list_view_filter(self):
+        """Asserts the list can be limited to packages with QC issues, most affected first."""
+        create_packages()
+        for count, package in enumerate(Package.objects.all(), start=1):
+            package.qc_issue_count = count
+            package.save()
+        Package.objects.filter(pk=Package.objects.first().pk).update(qc_issue_count=0)
+
+        response = self.client.get(reverse('package-list'))
+        self.assertEqual(len(response.context['object_list']), Package.objects.count())
+        response = self.client.get(reverse('package-list'), {'qc_issues': 1})
+        counts = [package.qc_issue_count for package in response.context['object_list']]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertNotIn(0, counts)
+
+
+class MediaFileViewTests(TestCase):
+
+    def setUp(self):
+        copy_binaries()
+        self.refid = 'f7d3dd6dc9c4732fa17dbd88fbe652b6'
+        self.url = reverse('media', args=[f'{self.refid}/{self.refid}.mp3'])
+        self.content = Path(settings.BASE_STORAGE_DIR, self.refid, f'{self.refid}.mp3').read_bytes()
+
+    def test_full_response(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(int(response['Content-Length']), len(self.content))
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_range_response(self):
+        """Asserts byte ranges are returned as partial content."""
+        for range_header, start, end in [('bytes=0-99', 0, 99), ('bytes=100-', 100, len(self.content) - 1), ('bytes=-50', len(self.content) - 50, len(self.content) - 1)]:
+            response = self.client.get(self.url, HTTP_RANGE=range_header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(self.content)}')
+            self.assertEqual(int(response['Content-Length']), end - start + 1)
+            self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_response(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Sendfile')
+    def test_sendfile_response(self):
+        """Asserts files are handed off to the web server when configured."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sendfile'], str(Path(settings.BASE_STORAGE_DIR, self.refid, f'{self.refid}.mp3')))
+        self.assertEqual(response.content, b'')
+
+    def test_not_found(self):
+        for path in ['missing.mp3', f'../{self.refid}/{self.refid}.mp3', '../manage.py']:
+            response = self.client.get(reverse('media', args=[path]))
+            self.assertEqual(response.status_code, 404)
+
+    def tearDown(self):
+        for dir in Path(settings.BASE_STORAGE_DIR).iterdir():
+            shutil.rmtree(dir)
+
+
 class HealthCheckEndpointTests(TestCase):
 
     def test_endpoint_response(self):
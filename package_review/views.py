@@ -1,14 +1,28 @@
-from os import getenv
+import json
+import mimetypes
+import os
+import re
 from pathlib import Path
-from shutil import rmtree
 
 from django.conf import settings
-from django.shortcuts import redirect
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.db import connection, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Prefetch, Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import (http_date, parse_http_date_safe,
+                               urlsafe_base64_decode, urlsafe_base64_encode)
 from django.views.generic import DetailView, ListView, TemplateView, View
 
-from .clients import ArchivesSpaceClient, AWSClient
-from .helpers import get_config
-from .models import Package, RightsStatement
+from .helpers import get_archivesspace_client
+from .models import (BulkAction, MediaCache, MediaFile, Package, PackageJob,
+                     RightsStatement)
+from .proxies import get_proxy_dir, get_proxy_filenames, touch_proxy
+from .visuals import waveform_path
 
 
 class RightsStatementMixin(View):
@@ -22,16 +36,196 @@ class RightsStatementMixin(View):
 
 
 class PackageListView(ListView):
-    """List view for packages waiting to be reviewed."""
+    """List view for packages waiting to be reviewed.
+
+    Packages are sorted and filtered in the database and paged with a cursor
+    holding the sort value and primary key of the last row shown, so each
+    page costs the same however many packages are waiting.
+    """
     template_name = 'list.html'
     model = Package
-    queryset = Package.objects.filter(process_status=Package.PENDING)
+    queryset = Package.objects.filter(process_status=Package.PENDING).only(
+        'av_number', 'av_number_sort', 'title', 'type', 'resource_title', 'resource_uri', 'multiple_masters',
+        'undated_object', 'possible_duplicate', 'fixity_status', 'qc_issue_count').prefetch_related(
+        Prefetch('jobs', queryset=PackageJob.objects.order_by('-created'), to_attr='recent_jobs'))
+    sort_fields = {
+        'av_number': 'av_number_sort',
+        'title': 'title',
+        'qc_issues': 'qc_issue_count',
+    }
+    flag_filters = [
+        ('multiple_masters', 'Multiple Master Files?'),
+        ('undated_object', 'Undated Object?'),
+        ('possible_duplicate', 'Possible Duplicate?'),
+        ('qc_issues', 'QC Issues?'),
+    ]
+
+    def get_paginate_by(self, queryset):
+        return settings.PACKAGE_LIST_PAGE_SIZE
+
+    def get_sort(self):
+        """Returns the requested sort key and whether it is descending."""
+        default = '-qc_issues' if self.request.GET.get('qc_issues') == '1' else 'av_number'
+        sort = self.request.GET.get('sort', default)
+        if sort.lstrip('-') not in self.sort_fields:
+            sort = default
+        return sort.lstrip('-'), sort.startswith('-')
+
+    def get_queryset(self):
+        """Applies filters from URL parameters."""
+        queryset = super().get_queryset()
+        params = self.request.GET
+        if params.get('type') in [str(value) for value, _ in Package.TYPE_CHOICES]:
+            queryset = queryset.filter(type=params['type'])
+        if params.get('collection'):
+            queryset = queryset.filter(resource_uri=params['collection'])
+        for flag, _ in self.flag_filters:
+            if params.get(flag) not in ['0', '1']:
+                continue
+            if flag == 'qc_issues':
+                condition = Q(qc_issue_count__gt=0)
+            else:
+                condition = Q(**{flag: True})
+            queryset = queryset.filter(condition if params[flag] == '1' else ~condition)
+        return queryset
+
+    def _encode_cursor(self, obj, field):
+        return urlsafe_base64_encode(json.dumps([getattr(obj, field), obj.pk]).encode())
+
+    def _decode_cursor(self, cursor, field):
+        """Returns the sort value and primary key held by a cursor, or None if it is not valid."""
+        if not cursor:
+            return None
+        try:
+            value, pk = json.loads(urlsafe_base64_decode(cursor))
+            return Package._meta.get_field(field).to_python(value), int(pk)
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def paginate_queryset(self, queryset, page_size):
+        """Returns one page of packages after or before a cursor.
+
+        Returns:
+            paginator, page, object_list, is_paginated (tuple): page is a dict
+                of cursors for the next and previous pages, which are None
+                at either end of the list.
+        """
+        sort, descending = self.get_sort()
+        field = self.sort_fields[sort]
+        after = self._decode_cursor(self.request.GET.get('after'), field)
+        before = None if after else self._decode_cursor(self.request.GET.get('before'), field)
+        backwards = before is not None
+        # Rows are read in reverse order when paging backwards, and put back
+        # in order once fetched.
+        reverse = descending != backwards
+        cursor = before or after
+        if cursor:
+            value, pk = cursor
+            lookup = 'lt' if reverse else 'gt'
+            queryset = queryset.filter(Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk}))
+        ordering = [f'-{field}', '-pk'] if reverse else [field, 'pk']
+        object_list = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(object_list) > page_size
+        object_list = object_list[:page_size]
+        if backwards:
+            object_list.reverse()
+        has_next = backwards or has_more
+        has_previous = has_more if backwards else after is not None
+        page = {
+            'next': self._encode_cursor(object_list[-1], field) if object_list and has_next else None,
+            'previous': self._encode_cursor(object_list[0], field) if object_list and has_previous else None,
+        }
+        return None, page, object_list, bool(page['next'] or page['previous'])
+
+    def _get_url(self, **params):
+        """Returns the URL of the list with the current parameters updated by params."""
+        query = self.request.GET.copy()
+        for key in ['after', 'before']:
+            query.pop(key, None)
+        for key, value in params.items():
+            if value is None:
+                query.pop(key, None)
+            else:
+                query[key] = value
+        return f'{self.request.path}?{query.urlencode()}'
+
+    def get_context_data(self, **kwargs):
+        """Adds URLs for sorting and paging to context."""
+        context = super().get_context_data(**kwargs)
+        sort, descending = self.get_sort()
+        page = context['page_obj']
+        context['sort'] = f'-{sort}' if descending else sort
+        context['sort_urls'] = {key: self._get_url(sort=f'-{key}' if key == sort and not descending else key) for key in self.sort_fields}
+        context['next_url'] = self._get_url(after=page['next']) if page['next'] else None
+        context['previous_url'] = self._get_url(before=page['previous']) if page['previous'] else None
+        context['type_choices'] = Package.TYPE_CHOICES
+        context['flag_filters'] = [(flag, label, self.request.GET.get(flag, '')) for flag, label in self.flag_filters]
+        context['collection_url'] = self._get_url(collection=None)
+        context['bulk_actions'] = BulkAction.objects.filter(jobs__status__in=PackageJob.ACTIVE_STATUSES).distinct().order_by('created')
+        return context
+
+
+class PackageSearchView(ListView):
+    """Searches packages by title, collection, AV number or refid, whatever their status.
+
+    PostgreSQL databases use the full-text search index, ranking the best
+    matches first. Other databases fall back to case-insensitive matching.
+    """
+    template_name = 'search.html'
+    model = Package
+
+    def get_queryset(self):
+        query = self.request.GET.get('q', '').strip()
+        if not query:
+            return Package.objects.none()
+        packages = Package.objects.only('av_number', 'title', 'type', 'resource_title', 'refid', 'process_status')
+        if connection.vendor == 'postgresql':
+            stemmed = SearchQuery(query, config='english', search_type='websearch')
+            search_query = stemmed | SearchQuery(query, config='simple', search_type='websearch')
+            queryset = packages.filter(search_vector=search_query).annotate(
+                rank=SearchRank(F('search_vector'), search_query)).order_by('-rank', '-pk')
+        else:
+            condition = Q()
+            for field in Package.SEARCH_FIELDS:
+                condition |= Q(**{f'{field}__icontains': query})
+            queryset = packages.filter(condition).order_by('-pk')
+        return queryset[:settings.SEARCH_RESULTS_LIMIT]
 
 
 class PackageDetailView(RightsStatementMixin, DetailView):
-    """Detail view for individual packages."""
+    """Detail view for individual packages.
+
+    The package structure is fetched separately by PackageTreeView when
+    it is opened.
+    """
     template_name = 'detail.html'
     model = Package
+    queryset = Package.objects.defer('tree', 'search_vector').annotate(
+        has_tree=ExpressionWrapper(Q(tree__isnull=False), output_field=BooleanField()))
+
+    def get_context_data(self, **kwargs):
+        """Adds URLs for review proxies and waveforms, if they have been generated."""
+        context = super().get_context_data(**kwargs)
+        proxy_dir = get_proxy_dir(self.object.refid)
+        for key, filename in zip(['proxy_url', 'playlist_url'], get_proxy_filenames(self.object.refid, self.object.type)):
+            if (proxy_dir / filename).is_file():
+                context[key] = f'{settings.PROXY_URL}{self.object.refid}/{filename}'
+        media_files = {media_file.path: media_file for media_file in self.object.media_files.filter(role=MediaFile.ACCESS)}
+        entries = MediaCache.objects.filter(path__in=media_files, waveform__isnull=False).only('path', 'waveform').annotate(
+            has_sprite=ExpressionWrapper(Q(sprite__isnull=False), output_field=BooleanField()))
+        context['visuals'] = [{
+            'media_file': media_files[entry.path],
+            'waveform_path': waveform_path(entry.waveform),
+            'waveform_width': len(entry.waveform) // 2,
+            'has_sprite': entry.has_sprite,
+        } for entry in entries]
+        return context
+
+
+class PackageTreeView(DetailView):
+    """Renders the files in a package."""
+    template_name = 'tree.html'
+    queryset = Package.objects.only('tree')
 
 
 class BulkActionListView(View):
@@ -41,7 +235,7 @@ class BulkActionListView(View):
         """Parses object list from object_list query param."""
         context = super().get_context_data(**kwargs)
         object_ids = [int(k) for k in self.request.GET]
-        context['object_list'] = Package.objects.filter(pk__in=object_ids)
+        context['object_list'] = Package.objects.filter(pk__in=object_ids).only('av_number', 'title')
         return context
 
 
@@ -63,76 +257,77 @@ class PackageActionView(View):
         object_ids = [int(pk) for pk in request.GET['object_list'].split(',')]
         return Package.objects.filter(pk__in=object_ids)
 
+    def _queue_jobs(self, request, rights_ids=None):
+        """Queues a job for each package which is waiting to be reviewed and does not already have one in progress.
 
-class PackageApproveView(PackageActionView):
-    """Approves a list of packages."""
-    message = 'Package reviewed and approved.'
-    outcome = 'SUCCESS'
+        Packages for which another request queues a job at the same time are
+        left with that job, as the database allows only one active job for
+        each package.
 
-    def post(self, request, *args, **kwargs):
-        queryset = self._get_queryset(request)
-        rights_ids = request.GET['rights_ids']
-        aws_client = AWSClient('sns', settings.AWS['role_arn'])
-        for package in queryset:
-            self.move_files(package)
-            aws_client.deliver_message(
-                settings.AWS['sns_topic'],
-                package,
-                self.message,
-                self.outcome,
-                rights_ids)
-            package.process_status = Package.APPROVED
-            package.rights_ids = rights_ids
-            package.save()
+        Returns:
+            bulk_action (BulkAction): the group of jobs which were queued.
+        """
+        queryset = self._get_queryset(request).filter(
+            process_status=Package.PENDING).exclude(jobs__status__in=PackageJob.ACTIVE_STATUSES).only('id')
+        with transaction.atomic():
+            bulk_action = BulkAction.objects.create(action=self.action)
+            PackageJob.objects.bulk_create(
+                [PackageJob(package=package, bulk_action=bulk_action, action=self.action, rights_ids=rights_ids) for package in queryset],
+                ignore_conflicts=True)
+        return bulk_action
+
+    def _get_response(self, request, bulk_action):
+        """Returns the ID of queued jobs to API clients, or returns reviewers to the package list."""
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({
+                'id': bulk_action.pk,
+                'progress_url': reverse('bulk-action-progress', args=[bulk_action.pk]),
+            }, status=202)
         return redirect('package-list')
 
-    def move_files(self, package):
-        """Moves files to packaging directory."""
-        bag_path = Path(settings.BASE_STORAGE_DIR, package.refid)
-        for fp in bag_path.iterdir():
-            new_path = Path(settings.BASE_DESTINATION_DIR, package.refid, fp.name)
-            new_path.parent.mkdir(parents=True, exist_ok=True)
-            fp.rename(new_path)
-        rmtree(bag_path)
+
+class PackageApproveView(PackageActionView):
+    """Queues approval of a list of packages."""
+    action = PackageJob.APPROVE
+
+    def post(self, request, *args, **kwargs):
+        bulk_action = self._queue_jobs(request, request.GET['rights_ids'])
+        return self._get_response(request, bulk_action)
 
 
 class PackageRejectView(PackageActionView):
-    """Rejects a list of packages."""
-    message = 'Package reviewed and rejected.'
-    outcome = 'FAILURE'
+    """Queues rejection of a list of packages."""
+    action = PackageJob.REJECT
 
     def post(self, request, *args, **kwargs):
-        queryset = self._get_queryset(request)
-        aws_client = AWSClient('sns', settings.AWS['role_arn'])
-        for package in queryset:
-            self.delete_files(package)
-            aws_client.deliver_message(
-                settings.AWS['sns_topic'],
-                package,
-                self.message,
-                self.outcome)
-            package.process_status = Package.REJECTED
-            package.save()
-        return redirect('package-list')
+        bulk_action = self._queue_jobs(request)
+        return self._get_response(request, bulk_action)
 
-    def delete_files(self, package):
-        """Removes files from storage directory."""
-        bag_dir = Path(settings.BASE_STORAGE_DIR, package.refid)
-        if bag_dir.exists():
-            rmtree(bag_dir)
+
+class BulkActionProgressView(View):
+    """Reports progress of a bulk approval or rejection as JSON."""
+
+    def get(self, request, *args, **kwargs):
+        bulk_action = get_object_or_404(BulkAction, pk=kwargs['pk'])
+        progress = bulk_action.get_progress()
+        if progress['failed']:
+            progress['errors'] = [
+                {'package': job.package_id, 'av_number': job.package.av_number, 'error': job.error}
+                for job in bulk_action.jobs.filter(status=PackageJob.FAILED).select_related('package').only('package__av_number', 'error')]
+        return JsonResponse({'id': bulk_action.pk, 'action': bulk_action.get_action_display(), **progress})
 
 
 class PackageDataRefreshView(PackageActionView):
     def get(self, request, *args, **kwargs):
         queryset = self._get_queryset(request)
-        configuration = get_config(f"/{getenv('ENV')}/{getenv('APP_CONFIG_PATH')}")
-        client = ArchivesSpaceClient(
-            baseurl=configuration.get('AS_BASEURL'),
-            username=configuration.get('AS_USERNAME'),
-            password=configuration.get('AS_PASSWORD'),
-            repository=configuration.get('AS_REPO'))
+        client = get_archivesspace_client()
+        refids = [package.refid for package in queryset]
+        client.invalidate_cache(refids)
+        packages_data = client.get_packages_data(refids)
         for package in queryset:
-            title, av_number, uri, resource_title, resource_uri, undated_object = client.get_package_data(package.refid)
+            if package.refid not in packages_data:
+                raise Exception(f'Expecting to get one result for ref id {package.refid} but got none instead.')
+            title, av_number, uri, resource_title, resource_uri, undated_object = packages_data[package.refid]
             package.title = title
             package.av_number = av_number
             package.uri = uri
@@ -141,3 +336,120 @@ class PackageDataRefreshView(PackageActionView):
             package.undated_object = undated_object
             package.save()
         return redirect('package-detail', pk=package.pk)
+
+
+class RangeFileWrapper(object):
+    """File-like object which reads a byte range of a file and then stops."""
+
+    def __init__(self, filelike, start, length):
+        self.filelike = filelike
+        self.filelike.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.filelike.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
+
+
+class MediaFileView(View):
+    """Serves media files with support for byte ranges and conditional requests.
+
+    If MEDIA_SENDFILE_HEADER is set, the file is handed off to the web server
+    (for example Apache with mod_xsendfile), which then handles ranges itself.
+    Otherwise the file is streamed from disk in blocks without being loaded
+    into memory.
+    """
+    root = settings.MEDIA_ROOT
+
+    def get_path(self, path):
+        try:
+            filepath = Path(safe_join(self.root, path))
+        except SuspiciousFileOperation:
+            raise Http404
+        if not filepath.is_file():
+            raise Http404
+        return filepath
+
+    def parse_range(self, request, size, etag, last_modified):
+        """Returns the (start, end) byte range requested, or None to send the whole file.
+
+        Only single ranges are supported; requests for several ranges are sent
+        the whole file, which RFC 9110 allows.
+        """
+        range_header = request.headers.get('Range', '')
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+            return None
+        first, last = match.groups()
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start > end or start >= size:
+            raise ValueError(f'Range {range_header} not satisfiable')
+        return start, end
+
+    def get(self, request, path, *args, **kwargs):
+        filepath = self.get_path(path)
+        stat = filepath.stat()
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        last_modified = int(stat.st_mtime)
+        content_type = mimetypes.guess_type(filepath.name)[0] or 'application/octet-stream'
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        if settings.MEDIA_SENDFILE_HEADER:
+            response = HttpResponse(content_type=content_type)
+            response[settings.MEDIA_SENDFILE_HEADER] = str(filepath)
+        else:
+            try:
+                byte_range = self.parse_range(request, stat.st_size, etag, last_modified)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+            if byte_range:
+                start, end = byte_range
+                response = FileResponse(RangeFileWrapper(open(filepath, 'rb'), start, end - start + 1), status=206, content_type=content_type)
+                response['Content-Length'] = end - start + 1
+                response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            else:
+                response = FileResponse(open(filepath, 'rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ProxyFileView(MediaFileView):
+    """Serves review proxies."""
+    root = settings.PROXY_ROOT
+
+    def get_path(self, path):
+        """Records use of the proxy once the requested path has been checked."""
+        filepath = super().get_path(path)
+        touch_proxy(filepath.relative_to(os.path.abspath(self.root)).parts[0])
+        return filepath
+
+
+class MediaFileSpriteView(View):
+    """Serves the thumbnail sprite sheet for a video file."""
+
+    def get(self, request, pk, *args, **kwargs):
+        media_file = get_object_or_404(MediaFile, pk=pk)
+        entry = MediaCache.objects.filter(path=media_file.path, sprite__isnull=False).only('sprite').first()
+        if not entry:
+            raise Http404
+        response = HttpResponse(bytes(entry.sprite), content_type='image/jpeg')
+        response['Cache-Control'] = 'private, max-age=3600'
+        return response
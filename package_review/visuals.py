@@ -0,0 +1,88 @@
+"""Waveform and thumbnail generation.
+
+This module deliberately does not import Django, so that its functions can
+be run in a process pool using the spawn start method.
+"""
+import math
+import subprocess
+from array import array
+
+SPRITE_COLUMNS = 10
+SPRITE_WIDTH = 160
+
+
+def compute_waveform(filepath, duration, peaks, sample_rate):
+    """Computes an array of peak amplitudes for the audio in a file.
+
+    Audio is decoded to mono 16-bit samples by ffmpeg and read from a pipe
+    one bucket at a time, so memory use does not depend on file length.
+
+    Args:
+        filepath (pathlib.Path): path to an audio or video file.
+        duration (float): duration of the file in seconds.
+        peaks (int): approximate number of peaks to return.
+        sample_rate (int): rate at which audio is decoded before peaks are taken.
+
+    Returns:
+        waveform (bytes): peak amplitudes (0-32767) as a packed array of signed shorts.
+    """
+    bucket_size = max(1, math.ceil(duration * sample_rate / peaks))
+    waveform = array('h')
+    samples = array('h')
+    with subprocess.Popen(
+            ['ffmpeg', '-nostdin', '-v', 'error', '-i', str(filepath), '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        while True:
+            data = process.stdout.read(bucket_size * samples.itemsize)
+            if len(data) < samples.itemsize:
+                break
+            samples = array('h', data[:len(data) - len(data) % samples.itemsize])
+            waveform.append(min(32767, max(max(samples), -min(samples))))
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, 'ffmpeg')
+    return waveform.tobytes()
+
+
+def compute_sprite(filepath, duration, count):
+    """Renders evenly spaced thumbnails from a video into a single JPEG sprite sheet.
+
+    Args:
+        filepath (pathlib.Path): path to a video file.
+        duration (float): duration of the file in seconds.
+        count (int): number of thumbnails.
+
+    Returns:
+        sprite (bytes): JPEG image with SPRITE_COLUMNS thumbnails per row.
+    """
+    rows = math.ceil(count / SPRITE_COLUMNS)
+    process = subprocess.run(
+        ['ffmpeg', '-nostdin', '-v', 'error', '-i', str(filepath), '-an',
+         '-vf', f'fps={count}/{max(duration, 1)},scale={SPRITE_WIDTH}:-2,tile={SPRITE_COLUMNS}x{rows}',
+         '-frames:v', '1', '-f', 'image2pipe', '-c:v', 'mjpeg', '-q:v', '5', '-'],
+        capture_output=True,
+        check=True)
+    return process.stdout
+
+
+def compute_visuals(filepath, duration, is_video, peaks, sample_rate, thumbnails):
+    """Computes a waveform and, for video, a sprite sheet for a file.
+
+    Returns:
+        waveform, sprite (tuple of bytes): sprite is None for audio files.
+    """
+    waveform = compute_waveform(filepath, duration, peaks, sample_rate)
+    sprite = compute_sprite(filepath, duration, thumbnails) if is_video else None
+    return waveform, sprite
+
+
+def waveform_path(waveform, height=100):
+    """Returns an SVG path drawing a waveform as one vertical line per peak.
+
+    Args:
+        waveform (bytes): packed peak amplitudes, as returned by compute_waveform.
+        height (int): height of the drawing.
+    """
+    middle = height / 2
+    return ''.join(
+        f'M{x} {middle - peak * middle / 32767:.1f}V{middle + peak * middle / 32767:.1f}'
+        for x, peak in enumerate(array('h', bytes(waveform))))
@@ -0,0 +1,148 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from pathlib import Path
+
+from .storage import directory_signature
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _package_path(root_path, path):
+    """Returns the top-level package directory containing a path."""
+    relative = path.relative_to(root_path)
+    return root_path / relative.parts[0] if relative.parts else None
+
+
+class InotifyWatcher(object):
+    """Watches a directory tree for changes using Linux inotify."""
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'Unable to initialize inotify')
+        self.watches = {}
+        self._add_watches(root_path)
+
+    def _add_watches(self, dir_path):
+        """Adds watches to a directory and all directories below it."""
+        for root, dirs, _ in os.walk(dir_path):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOENT:
+                    continue
+                raise OSError(error, f'Unable to watch {root}')
+            self.watches[wd] = Path(root)
+
+    def wait(self, timeout):
+        """Waits for changes.
+
+        Args:
+            timeout (float): maximum number of seconds to wait.
+
+        Returns:
+            changed_paths (set of pathlib.Path): package directories which changed.
+        """
+        changed_paths = set()
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return changed_paths
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so any package may have changed,
+                # including directories which were created without a watch.
+                self._add_watches(self.root_path)
+                changed_paths.update(self.root_path.iterdir())
+                continue
+            dir_path = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            if dir_path is None:
+                continue
+            path = dir_path / os.fsdecode(name) if name else dir_path
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and path.is_dir():
+                self._add_watches(path)
+            package_path = _package_path(self.root_path, path)
+            if package_path:
+                changed_paths.add(package_path)
+        return changed_paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """Watches a directory for changes by periodically comparing directory signatures."""
+
+    def __init__(self, root_path, interval):
+        self.root_path = root_path
+        self.interval = interval
+        self.signatures = self._get_signatures()
+        self.last_poll = time.monotonic()
+
+    def _get_signatures(self):
+        signatures = {}
+        for path in self.root_path.iterdir():
+            try:
+                signatures[path] = directory_signature(path)
+            except FileNotFoundError:
+                # The directory changed while it was being read.
+                signatures[path] = None
+        return signatures
+
+    def wait(self, timeout):
+        """Waits for changes.
+
+        Args:
+            timeout (float): maximum number of seconds to wait.
+
+        Returns:
+            changed_paths (set of pathlib.Path): package directories which changed.
+        """
+        remaining = self.interval - (time.monotonic() - self.last_poll)
+        if remaining > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(remaining, 0))
+        signatures = self._get_signatures()
+        changed_paths = {path for path in signatures.keys() | self.signatures.keys() if signatures.get(path) != self.signatures.get(path)}
+        self.signatures = signatures
+        self.last_poll = time.monotonic()
+        return changed_paths
+
+    def close(self):
+        pass
+
+
+def get_watcher(root_path, poll_interval):
+    """Returns an inotify watcher for a directory, or a polling watcher if inotify is not available."""
+    try:
+        return InotifyWatcher(root_path)
+    except (AttributeError, OSError):
+        return PollingWatcher(root_path, poll_interval)